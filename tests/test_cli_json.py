@@ -0,0 +1,32 @@
+#
+# Copyright (c) 2022 Samuel J. McKelvie
+#
+# MIT License - See LICENSE file accompanying this package.
+#
+
+"""Tests that CLI JSON output is byte-for-byte what json.dumps produces"""
+
+import json
+
+import pytest
+
+pytest.importorskip('project_init_tools')
+
+from xpulumi.cli import _dumps_json_bytes
+
+VALUES = [
+    { 'b': 1, 'a': [ True, None, "x" ], 'c': { 'z': {}, 'y': [] } },
+    { 'a': 1e16, 'b': 1e-7, 'c': 0.5, 'd': 1.0 },
+    [ float('nan'), float('inf'), float('-inf') ],
+    { 'a': "café" },
+    { 'a': 2**70 },
+  ]
+
+@pytest.mark.parametrize('value', VALUES)
+@pytest.mark.parametrize('compact', [ True, False ])
+def test_dumps_json_bytes_matches_json(value, compact: bool):
+  if compact:
+    expected = json.dumps(value, separators=(',', ':'), sort_keys=True)
+  else:
+    expected = json.dumps(value, indent=2, sort_keys=True)
+  assert _dumps_json_bytes(value, compact) == expected.encode('utf-8')
@@ -0,0 +1,64 @@
+#
+# Copyright (c) 2022 Samuel J. McKelvie
+#
+# MIT License - See LICENSE file accompanying this package.
+#
+
+"""Tests for EncryptedStringProvider's deterministic nonce derivation"""
+
+from base64 import b64encode
+
+import pytest
+
+pytest.importorskip('project_init_tools')
+pytest.importorskip('pulumi')
+pulumi_crypto = pytest.importorskip('pulumi_crypto')
+
+from xpulumi.runtime_support.encrypted_string_provider import (
+    EncryptedStringProvider,
+    _derive_nonce,
+  )
+
+KEY = bytes(range(pulumi_crypto.KEY_SIZE_BYTES))
+
+def test_derive_nonce_is_deterministic():
+  nonce = _derive_nonce(KEY, 1, "hello")
+  assert len(nonce) == pulumi_crypto.NONCE_SIZE_BYTES
+  assert _derive_nonce(KEY, 1, "hello") == nonce
+
+def test_derive_nonce_differs_per_input():
+  nonce = _derive_nonce(KEY, 1, "hello")
+  assert _derive_nonce(KEY, 1, "world") != nonce
+  assert _derive_nonce(KEY, 2, "hello") != nonce
+  assert _derive_nonce(bytes(reversed(KEY)), 1, "hello") != nonce
+
+def test_derive_nonce_does_not_use_key_directly():
+  # HKDF(key, salt=revision, context=plaintext) was the original construction; the nonce
+  # must come from a separate sub-key instead.
+  from Cryptodome.Protocol.KDF import HKDF
+  from Cryptodome.Hash import SHA256
+  direct = HKDF(KEY, pulumi_crypto.NONCE_SIZE_BYTES, b'1', SHA256, context=b'hello')
+  assert _derive_nonce(KEY, 1, "hello") != direct
+
+def _gen_ciphertext(plaintext: str, deterministic_nonce: bool) -> str:
+  outs = EncryptedStringProvider()._gen_outs(
+      'test',
+      plaintext,
+      b64encode(KEY).decode('utf-8'),
+      1,
+      deterministic_nonce=deterministic_nonce,
+    )
+  ciphertext = outs['ciphertext']
+  assert isinstance(ciphertext, str)
+  return ciphertext
+
+def test_deterministic_ciphertext_is_stable():
+  ciphertext = _gen_ciphertext("hello", True)
+  assert _gen_ciphertext("hello", True) == ciphertext
+  assert pulumi_crypto.decrypt_string(ciphertext, KEY) == "hello"
+
+def test_deterministic_ciphertext_differs_per_plaintext():
+  assert _gen_ciphertext("hello", True) != _gen_ciphertext("world", True)
+
+def test_random_nonce_ciphertext_differs():
+  assert _gen_ciphertext("hello", False) != _gen_ciphertext("hello", False)
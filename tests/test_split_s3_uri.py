@@ -0,0 +1,33 @@
+#
+# Copyright (c) 2022 Samuel J. McKelvie
+#
+# MIT License - See LICENSE file accompanying this package.
+#
+
+"""Tests that split_s3_uri agrees with urlparse-based parsing"""
+
+import pytest
+
+pytest.importorskip('project_init_tools')
+
+from xpulumi.exceptions import XPulumiError
+from xpulumi.util import split_s3_uri
+
+@pytest.mark.parametrize('uri, expected', [
+    ('s3://my-bucket', ('my-bucket', '')),
+    ('s3://my-bucket/', ('my-bucket', '')),
+    ('s3://my-bucket//a/b.json', ('my-bucket', 'a/b.json')),
+    ('s3://my-bucket?region=us-west-2', ('my-bucket', '')),
+    ('s3://my-bucket?region=us-west-2&awssdk=v2', ('my-bucket', '')),
+    ('s3://my-bucket/prefix?region=us-west-2', ('my-bucket', 'prefix')),
+    ('s3://my-bucket/prefix#frag', ('my-bucket', 'prefix')),
+    ('S3://my-bucket/prefix', ('my-bucket', 'prefix')),
+    (' s3://my-bucket/prefix', ('my-bucket', 'prefix')),
+  ])
+def test_split_s3_uri(uri: str, expected):
+  assert split_s3_uri(uri) == expected
+
+@pytest.mark.parametrize('uri', [ 'https://my-bucket/prefix', 'my-bucket/prefix', '' ])
+def test_split_s3_uri_rejects_other_schemes(uri: str):
+  with pytest.raises(XPulumiError):
+    split_s3_uri(uri)
@@ -0,0 +1,106 @@
+#
+# Copyright (c) 2022 Samuel J. McKelvie
+#
+# MIT License - See LICENSE file accompanying this package.
+#
+
+"""Tests that in-process known_hosts entry removal matches "ssh-keygen -R" """
+
+from typing import List
+
+import os
+import shutil
+import subprocess
+
+import pytest
+
+pytest.importorskip('project_init_tools')
+pytest.importorskip('pulumi')
+
+from xpulumi.runtime_support import ssh_hostkey_provider
+
+if shutil.which('ssh-keygen') is None:
+  pytest.skip("ssh-keygen is required to compare results", allow_module_level=True)
+
+REMOVE_NAMES = [ 'host1.example.com', '10.0.0.1', 'HOST4.example.com' ]
+
+def _gen_public_key(tmp_path, name: str) -> str:
+  key_file = os.path.join(str(tmp_path), f"key-{name}")
+  subprocess.check_call(
+      [ 'ssh-keygen', '-q', '-t', 'ed25519', '-N', '', '-C', '', '-f', key_file ],
+      stdout=subprocess.DEVNULL,
+    )
+  with open(key_file + '.pub', encoding='utf-8') as f:
+    fields = f.read().split()
+  return f"{fields[0]} {fields[1]}"
+
+def _write_known_hosts(tmp_path, hashed: bool) -> str:
+  keys = [ _gen_public_key(tmp_path, str(i)) for i in range(6) ]
+  lines: List[str] = [
+      "# a comment that mentions host1.example.com",
+      f"host1.example.com {keys[0]}",
+      "",
+      f"host2.example.com,10.0.0.2 {keys[1]}",
+      f"host3.example.com,10.0.0.1 {keys[2]}",
+      f"@cert-authority host1.example.com {keys[3]}",
+      f"10.0.0.3 {keys[4]}",
+      f"Host4.Example.COM {keys[5]}",
+    ]
+  known_hosts = os.path.join(str(tmp_path), 'known_hosts')
+  with open(known_hosts, 'w', encoding='utf-8') as f:
+    f.write('\n'.join(lines) + '\n')
+  if hashed:
+    subprocess.check_call([ 'ssh-keygen', '-H', '-f', known_hosts ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+  return known_hosts
+
+def _read(pathname: str) -> bytes:
+  with open(pathname, 'rb') as f:
+    return f.read()
+
+@pytest.mark.parametrize('hashed', [ False, True ])
+def test_remove_entries_matches_ssh_keygen(tmp_path, monkeypatch, hashed: bool):
+  known_hosts = _write_known_hosts(tmp_path, hashed)
+  original = _read(known_hosts)
+  expected_file = os.path.join(str(tmp_path), 'expected_known_hosts')
+  shutil.copyfile(known_hosts, expected_file)
+  for name in REMOVE_NAMES:
+    # ssh, ssh-keyscan and "ssh-keygen -H" hash lower-cased host names, but "ssh-keygen -R"
+    # only lower-cases the name for plain entries; pass it lower-cased so hashed entries match
+    subprocess.check_call(
+        [ 'ssh-keygen', '-f', expected_file, '-R', name.lower() ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+      )
+
+  monkeypatch.setattr(ssh_hostkey_provider, '_get_known_hosts_pathname', lambda: known_hosts)
+  result = ssh_hostkey_provider._remove_entries_py(REMOVE_NAMES)
+  assert not result is None
+  assert _read(known_hosts) == _read(expected_file)
+  # ssh-keygen runs once per name, so only the single-pass .old is the original file
+  assert _read(known_hosts + '.old') == original
+  assert f"{known_hosts} updated." in result
+
+def test_remove_entries_without_match_leaves_file_unchanged(tmp_path, monkeypatch):
+  known_hosts = _write_known_hosts(tmp_path, False)
+  before = _read(known_hosts)
+  monkeypatch.setattr(ssh_hostkey_provider, '_get_known_hosts_pathname', lambda: known_hosts)
+  assert ssh_hostkey_provider._remove_entries_py([ 'nosuchhost.example.com' ]) == ''
+  assert _read(known_hosts) == before
+
+def test_remove_entries_non_utf8_falls_back(tmp_path, monkeypatch):
+  known_hosts = _write_known_hosts(tmp_path, False)
+  with open(known_hosts, 'ab') as f:
+    f.write(b'# caf\xe9\n')
+  before = _read(known_hosts)
+  monkeypatch.setattr(ssh_hostkey_provider, '_get_known_hosts_pathname', lambda: known_hosts)
+  assert ssh_hostkey_provider._remove_entries_py(REMOVE_NAMES) is None
+  assert _read(known_hosts) == before
+
+def test_remove_entries_with_pattern_falls_back(tmp_path, monkeypatch):
+  known_hosts = _write_known_hosts(tmp_path, False)
+  with open(known_hosts, 'a', encoding='utf-8') as f:
+    f.write(f"*.example.com {_gen_public_key(tmp_path, 'pattern')}\n")
+  before = _read(known_hosts)
+  monkeypatch.setattr(ssh_hostkey_provider, '_get_known_hosts_pathname', lambda: known_hosts)
+  assert ssh_hostkey_provider._remove_entries_py(REMOVE_NAMES) is None
+  assert _read(known_hosts) == before
@@ -86,7 +86,10 @@ class PulumiApiClient:
         "User-Agent": self._user_agent,
       }
     if gzip_req_data and not req_data is None and len(req_data) > 0:
-      req_data = zlib.compress(req_data)
+      # wbits=16+MAX_WBITS emits a gzip member (zlib.compress alone emits a zlib stream, which
+      # is not what Content-Encoding: gzip promises), without GzipFile's Python-level framing
+      compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+      req_data = compressor.compress(req_data) + compressor.flush()
       headers['Content-Encoding'] = 'gzip'
     resp = self._requests_session.request(method, req_url, params=req_params, data=req_data, headers=headers)
     # NOTE: A warning message may be returned in header X-Pulumi-Warning, and we could log that
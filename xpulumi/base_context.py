@@ -11,7 +11,7 @@ on demand.
 
 """
 
-from typing import TYPE_CHECKING, Optional, cast, Dict, Tuple, List, Callable, Union, Any, Set, Iterable
+from typing import TYPE_CHECKING, Optional, cast, Dict, Tuple, List, Callable, Union, Any, Set, Iterable, Iterator
 from .internal_types import Jsonable, JsonableDict
 
 import os
@@ -321,23 +321,40 @@ class XPulumiContextBase(XPulumiContext):
     """
     dependency_list: List['XPulumiStack'] = []
     dependency_set: Set[str] = set()
+    # xstack names on the current DFS path, in order, and as a set for fast cycle checks
     processing_stack: List[str] = []
+    processing_set: Set[str] = set()
+
+    # Iterative DFS; each work item is a stack on the current path and an iterator
+    # over its not-yet-visited dependencies
+    work: List[Tuple['XPulumiStack', Iterator['XPulumiStack']]] = []
+
+    def push_stack(stack: 'XPulumiStack', xstack: str) -> None:
+      processing_stack.append(xstack)
+      processing_set.add(xstack)
+      work.append((stack, iter(stack.get_stack_dependencies())))
 
-    def add_stack(stack: 'XPulumiStack'):
-      xstack = stack.full_stack_name
-      if xstack in processing_stack:
-        raise XPulumiError(f"Circular dependency between xstacks: {processing_stack + [ xstack ] }")
-      if not xstack in dependency_set:
-        processing_stack.append(xstack)
-        deps = stack.get_stack_dependencies()
-        for dep in deps:
-          add_stack(dep)
-        assert not xstack in dependency_set
-        dependency_list.append(stack)
-        dependency_set.add(xstack)
-        processing_stack.pop()
     for top_stack in stacks:
-      add_stack(top_stack)
+      top_xstack = top_stack.full_stack_name
+      if top_xstack in dependency_set:
+        continue
+      push_stack(top_stack, top_xstack)
+      while len(work) > 0:
+        stack, deps = work[-1]
+        dep = next(deps, None)
+        if dep is None:
+          work.pop()
+          xstack = processing_stack.pop()
+          processing_set.remove(xstack)
+          assert not xstack in dependency_set
+          dependency_list.append(stack)
+          dependency_set.add(xstack)
+        else:
+          dep_xstack = dep.full_stack_name
+          if dep_xstack in processing_set:
+            raise XPulumiError(f"Circular dependency between xstacks: {processing_stack + [ dep_xstack ] }")
+          if not dep_xstack in dependency_set:
+            push_stack(dep, dep_xstack)
     return dependency_list
 
   def get_stack_build_order(self, stack: 'XPulumiStack', include_self: bool=False) -> List['XPulumiStack']:
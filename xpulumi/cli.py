@@ -5,26 +5,23 @@
 
 """xpulumi CLI"""
 
-import base64
 from typing import (
     TYPE_CHECKING, Optional, Sequence, List, Union, Dict, TextIO, Mapping, MutableMapping,
     cast, Any, Iterator, Iterable, Tuple, ItemsView, ValuesView, KeysView, Type )
 
 import os
+import re
 import sys
+import shutil
 import argparse
+import codecs
 import argcomplete # type: ignore[import]
 import json
-from base64 import b64encode, b64decode
-import colorama # type: ignore[import]
-from colorama import Fore, Back, Style
-import subprocess
-from io import TextIOWrapper
-import yaml
-from secret_kv import create_kv_store
+try:
+  import orjson
+except ImportError:
+  orjson = None  # type: ignore[assignment]
 from urllib.parse import urlparse, ParseResult
-import ruamel.yaml # type: ignore[import]
-from io import StringIO
 
 from project_init_tools import (
     file_contents,
@@ -36,6 +33,7 @@ from project_init_tools import (
     pathname_to_file_url,
     RoundTripConfig,
     sudo_call,
+    run_once,
   )
 
 from xpulumi.stack import XPulumiStack
@@ -50,6 +48,96 @@ from .constants import XPULUMI_CONFIG_DIRNAME, XPULUMI_CONFIG_FILENAME_BASE
 from .version import __version__ as pkg_version
 from .project import XPulumiProject
 
+def _has_float(value: Jsonable) -> bool:
+  """Returns True if value contains a float at any depth"""
+  if isinstance(value, float):
+    return True
+  if isinstance(value, dict):
+    return any(_has_float(x) for x in value.values())
+  if isinstance(value, list):
+    return any(_has_float(x) for x in value)
+  return False
+
+def _dumps_json_bytes(value: Jsonable, compact: bool) -> bytes:
+  """Serializes a value as sorted-key JSON with the same bytes as json.dumps with
+     separators=(',', ':') (compact) or indent=2, using orjson when it is available
+     and the value holds nothing orjson writes differently."""
+  if not orjson is None:
+    try:
+      data = orjson.dumps(value, option=orjson.OPT_SORT_KEYS if compact else orjson.OPT_SORT_KEYS | orjson.OPT_INDENT_2)
+    except TypeError:
+      # e.g., non-str keys or integers too large for orjson; json handles these
+      pass
+    else:
+      # orjson emits non-ASCII characters as UTF-8, NaN/Infinity as null, and exponents
+      # without a sign or zero padding (1e16, 1e-7 vs. json's 1e+16, 1e-07); keep
+      # json's output for any of those.
+      if data.isascii() and not _has_float(value):
+        return data
+  if compact:
+    text = json.dumps(value, separators=(',', ':'), sort_keys=True)
+  else:
+    text = json.dumps(value, indent=2, sort_keys=True)
+  return text.encode('utf-8')
+
+_ASCII_COMPATIBLE_CODECS = frozenset([ 'utf-8', 'ascii', 'iso8859-1', 'cp1252' ])
+
+def _write_json_bytes(f: TextIO, data: bytes) -> None:
+  """Writes a line of ASCII JSON bytes from _dumps_json_bytes to a text stream, going
+     straight to the stream's binary buffer when its encoding leaves ASCII unchanged."""
+  buffer = getattr(f, 'buffer', None)
+  encoding = getattr(f, 'encoding', None)
+  if buffer is None or encoding is None or codecs.lookup(encoding).name not in _ASCII_COMPATIBLE_CODECS:
+    f.write(data.decode('ascii'))
+    f.write('\n')
+  else:
+    f.flush()
+    buffer.write(data)
+    buffer.write(b'\n')
+    buffer.flush()
+
+_JSON_TOKEN_RE = re.compile(
+    r'("(?:[^"\\]|\\.)*")(\s*:)?'          # string, or object key if followed by ':'
+    r'|(-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)'   # number
+    r'|(true|false)'
+    r'|(null)'
+    r'|([{}\[\]])'                            # structure
+  )
+
+def _colorize_json(text: str) -> str:
+  """Adds ANSI colors to serialized JSON text in the style of jq's default colors,
+     without running jq."""
+  from colorama import Fore, Style  # type: ignore[import]
+  reset = Style.RESET_ALL
+  string_color = Fore.GREEN
+  key_color = Fore.BLUE + Style.BRIGHT
+  null_color = Fore.BLACK + Style.BRIGHT
+  struct_color = Style.BRIGHT
+
+  def colorize_match(m: 're.Match[str]') -> str:
+    s = m.group(1)
+    if not s is None:
+      if m.group(2) is None:
+        return f"{string_color}{s}{reset}"
+      return f"{key_color}{s}{reset}{m.group(2)}"
+    s = m.group(5)
+    if not s is None:
+      return f"{null_color}{s}{reset}"
+    s = m.group(6)
+    if not s is None:
+      return f"{struct_color}{s}{reset}"
+    return m.group(0)
+
+  return _JSON_TOKEN_RE.sub(colorize_match, text)
+
+@run_once
+def get_jq_prog() -> str:
+  """Returns the pathname of jq, found with a single PATH search per process"""
+  result = shutil.which('jq')
+  if result is None:
+    raise XPulumiError("XPULUMI_JSON_COLORIZER=jq was set, but jq was not found in PATH")
+  return result
+
 def is_colorizable(stream: TextIO) -> bool:
   is_a_tty = hasattr(stream, 'isatty') and stream.isatty()
   return is_a_tty
@@ -79,6 +167,7 @@ class CommandLineInterface:
   _parser: argparse.ArgumentParser
   _args: argparse.Namespace
   _cwd: str
+  _home: str
 
   _cfg: Optional[XPulumiConfig] = None
   _ctx: Optional[XPulumiContextBase] = None
@@ -97,9 +186,13 @@ class CommandLineInterface:
 
   _colorize_stdout: bool = False
   _colorize_stderr: bool = False
+  _err_prefix: str = ''
+  _err_suffix: str = ''
 
   def __init__(self, argv: Optional[Sequence[str]]=None):
     self._argv = argv
+    # Like expanduser, drop any trailing separator so a HOME of '/' does not yield '//'
+    self._home = os.path.expanduser('~').rstrip(os.sep)
 
   def ocolor(self, codes: str) -> str:
     return codes if self._colorize_stdout else ""
@@ -112,7 +205,12 @@ class CommandLineInterface:
     return self._cwd
 
   def abspath(self, path: str) -> str:
-    return os.path.abspath(os.path.join(self.cwd, os.path.expanduser(path)))
+    if path.startswith('~'):
+      if path == '~' or path.startswith('~/'):
+        path = (self._home + path[1:]) or os.sep
+      else:
+        path = os.path.expanduser(path)
+    return os.path.abspath(path if os.path.isabs(path) else os.path.join(self._cwd, path))
 
   def pretty_print(
         self,
@@ -138,19 +236,19 @@ class CommandLineInterface:
       final_colorize = colorize and ((f is sys.stdout and self._colorize_stdout) or (f is sys.stderr and self._colorize_stderr))
 
       if not final_colorize:
-        if compact:
-          json.dump(value, f, separators=(',', ':'), sort_keys=True)
-        else:
-          json.dump(value, f, indent=2, sort_keys=True)
+        _write_json_bytes(f, _dumps_json_bytes(value, compact))
+      elif os.environ.get('XPULUMI_JSON_COLORIZER', '') != 'jq':
+        f.write(_colorize_json(_dumps_json_bytes(value, compact).decode('utf-8')))
         f.write('\n')
       else:
-        jq_input = json.dumps(value, separators=(',', ':'), sort_keys=True)
-        cmd = [ 'jq' ]
+        import subprocess
+        jq_input = _dumps_json_bytes(value, True)
+        cmd = [ get_jq_prog() ]
         if compact:
           cmd.append('-c')
         cmd.append('.')
         with subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=f) as proc:
-          proc.communicate(input=jq_input.encode('utf-8'))
+          proc.communicate(input=jq_input)
           exit_code = proc.returncode
         if exit_code != 0:
           raise subprocess.CalledProcessError(exit_code, cmd)
@@ -374,6 +472,7 @@ class CommandLineInterface:
     return 0
 
   def cmd_stack_all_up(self) -> int:
+    from colorama import Fore, Style  # type: ignore[import]
     stack = self.get_required_selected_stack()
     deps = stack.get_stack_build_order()
     for build_stack in deps + [ stack ]:
@@ -624,6 +723,7 @@ class CommandLineInterface:
         self._colorize_stdout = is_colorizable(sys.stdout)
         self._colorize_stderr = is_colorizable(sys.stderr)
         if self._colorize_stdout or self._colorize_stderr:
+          import colorama  # type: ignore[import]
           colorama.init(wrap=False)
           if self._colorize_stdout:
             new_stream = colorama.AnsiToWin32(sys.stdout)
@@ -633,6 +733,8 @@ class CommandLineInterface:
             new_stream = colorama.AnsiToWin32(sys.stderr)
             if new_stream.should_wrap():
               sys.stderr = new_stream
+            self._err_prefix = colorama.Fore.RED
+            self._err_suffix = colorama.Style.RESET_ALL
       self._cwd = os.path.abspath(os.path.expanduser(args.cwd))
       config_file: Optional[str] = args.config
       if not config_file is None:
@@ -651,7 +753,7 @@ class CommandLineInterface:
         if ex_desc == '':
           ex_desc = full_type(ex)
 
-        print(f"{self.ecolor(Fore.RED)}xpulumi: error: {ex_desc}{self.ecolor(Style.RESET_ALL)}", file=sys.stderr)
+        sys.stderr.write(f"{self._err_prefix}xpulumi: error: {ex_desc}{self._err_suffix}\n")
     return rc
 
   @property
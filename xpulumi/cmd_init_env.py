@@ -605,11 +605,15 @@ class CmdInitEnv(CommandHandler):
       if not project_authors is None and len(project_authors) == 1:
         project_author = str(project_authors[0])
         _, email_address = split_name_and_email(project_author)
+      # The git setting is needed both as a default and to decide whether to set it below,
+      # so only run git once
+      git_email_address: Optional[str] = None
+      try:
+        git_email_address = get_git_user_email()
+      except KeyError:
+        pass
       if email_address is None:
-        try:
-          email_address = get_git_user_email()
-        except KeyError:
-          pass
+        email_address = git_email_address
 
       self._email_address = cast(str, self.get_or_prompt_config_val(
           'email_address',
@@ -622,9 +626,7 @@ class CmdInitEnv(CommandHandler):
             cache_is_priority_default=True,
         ))
 
-      try:
-        get_git_user_email()
-      except KeyError:
+      if git_email_address is None:
         set_git_user_email(self._email_address)
 
     return self._email_address
@@ -646,11 +648,13 @@ class CmdInitEnv(CommandHandler):
       if not project_authors is None and len(project_authors) == 1:
         project_author = str(project_authors[0])
         friendly_name, _ = split_name_and_email(project_author)
+      git_friendly_name: Optional[str] = None
+      try:
+        git_friendly_name = get_git_user_friendly_name()
+      except KeyError:
+        pass
       if friendly_name is None:
-        try:
-          friendly_name = get_git_user_friendly_name()
-        except KeyError:
-          pass
+        friendly_name = git_friendly_name
 
       self._friendly_name = cast(str, self.get_or_prompt_config_val(
           'friendly_name',
@@ -662,9 +666,7 @@ class CmdInitEnv(CommandHandler):
             default=friendly_name,
             cache_is_priority_default=True
         ))
-      try:
-        get_git_user_friendly_name()
-      except KeyError:
+      if git_friendly_name is None:
         set_git_user_friendly_name(self._friendly_name)
 
     return self._friendly_name
@@ -384,6 +384,7 @@ class XPulumiProject:
 
   def invalidate_stacks_metadata(self) -> None:
     self._stacks_metadata = None
+    self._all_stacks_known = False
 
   def get_stack_names(self) -> List[str]:
     return sorted(self.get_stacks().keys())
@@ -421,6 +422,7 @@ class XPulumiProject:
           if len(stack_name) > 0:
             if not stack_name in self._stacks:
               self.get_stack(stack_name, create=True)
+      self._all_stacks_known = True
     return self._stacks
 
   def get_inited_stacks(self) -> Dict[str, 'XPulumiStack']:
@@ -13,11 +13,12 @@ from copy import deepcopy
 from lib2to3.pgen2.token import OP
 import os
 import sys
+import shutil
 import json
 import subprocess
 import colorama # type: ignore[import]
 from colorama import Fore, Back, Style
-from project_init_tools import deactivate_virtualenv, find_command_in_path, get_git_root_dir
+from project_init_tools import deactivate_virtualenv, get_git_root_dir
 
 # NOTE: this module runs with -m; do not use relative imports
 from xpulumi.backend import XPulumiBackend
@@ -645,7 +646,7 @@ def _get_raw_pulumi() -> Tuple[str, str]:
           return project_pulumi_prog, project_pulumi_home
     novenv = dict(os.environ)
     deactivate_virtualenv(novenv)
-    path_pulumi_prog = find_command_in_path('pulumi', searchpath=novenv['PATH'])
+    path_pulumi_prog = shutil.which('pulumi', path=novenv['PATH'])
     if not path_pulumi_prog is None:
       path_pulumi_home = os.path.dirname(os.path.dirname(path_pulumi_prog))
       return path_pulumi_prog, path_pulumi_home
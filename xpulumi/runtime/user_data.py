@@ -187,12 +187,12 @@ class UserData:
       ) -> Output[Optional[Union[str, bytes]]]:
     sync_parts = [x.sync_part for x in self.parts]
 
+    # sync_render is a plain callable, so it is bound directly rather than passed through Output.all
     result: Output[Optional[Union[str, bytes]]] = Output.all(
         self.init_content,
         self.init_mime_type,
         self.init_headers,
         self.init_priority,
-        sync_render,
         include_mime_version,
         *sync_parts
       ).apply(
@@ -201,9 +201,9 @@ class UserData:
             cast(Optional[str], args[1]),
             cast(MimeHeadersConvertible, args[2]),
             cast(int, args[3]),
-            cast(SyncRenderCallback, args[4]),
-            cast(bool, args[5]),
-            cast(List[CloudInitPart], args[6:])
+            sync_render,
+            cast(bool, args[4]),
+            cast(List[CloudInitPart], args[5:])
           )
       )
     return result
@@ -8,6 +8,10 @@ import json
 import ipaddress
 from secret_kv import Jsonable
 import yaml
+try:
+  from yaml import CSafeDumper as YamlDumper
+except ImportError:
+  from yaml import SafeDumper as YamlDumper  # type: ignore[misc]
 import boto3.session
 import botocore.client
 import threading
@@ -291,7 +295,7 @@ def yamlify_promise(
   def gen_yaml(obj: Jsonable, indent: int, default_flow_style: Optional[bool], width: int, prefix_text: Optional[str]) -> str:
     if prefix_text is None:
       prefix_text = ''
-    return prefix_text + yaml.dump(obj, sort_keys=True, indent=indent, default_flow_style=default_flow_style, width=width)
+    return prefix_text + yaml.dump(obj, Dumper=YamlDumper, sort_keys=True, indent=indent, default_flow_style=default_flow_style, width=width)
 
   result = Output.all(future_obj, indent, default_flow_style, width, prefix_text).apply(lambda args: gen_yaml(*args)) # type: ignore [arg-type]
   return result
@@ -1,5 +1,6 @@
 from project_init_tools import full_name_of_type, full_type
 from ..internal_types import JsonableDict
+from ..util import coerce_pulumi_int
 #from project_init_tools import gen_etc_shadow_password_hash as sync_gen_etc_shadow_password_hash
 from typing import Any, Optional, List, cast
 from pulumi.dynamic import ResourceProvider, CreateResult, Resource, DiffResult, UpdateResult, CheckResult, CheckFailure
@@ -7,7 +8,7 @@ from pulumi import ResourceOptions, Input, Output
 import pulumi
 
 import Cryptodome
-from Cryptodome.Protocol.KDF import PBKDF2
+from Cryptodome.Protocol.KDF import PBKDF2, HKDF
 from Cryptodome.Hash import SHA256
 from Cryptodome.Cipher import AES
 from Cryptodome.Cipher._mode_gcm import GcmMode
@@ -23,11 +24,29 @@ from pulumi_crypto import (
     encrypt_string,
     decrypt_string,
     generate_nonce,
-    KEY_SIZE_BYTES
+    KEY_SIZE_BYTES,
+    NONCE_SIZE_BYTES,
   )
 
 _DEBUG_PROVIDER = False
 
+def _derive_nonce(key: bytes, key_revision: int, plaintext: str) -> bytes:
+  """Deterministically derives a nonce from the key, key revision and plaintext.
+
+  A nonce sub-key is first derived from the AES key, so the encryption key itself is
+  never used directly as HKDF input keying material for the nonce. The (key, nonce) pair
+  remains unique per (key_revision, plaintext), so a nonce is only ever reused to
+  encrypt identical inputs, producing identical ciphertext.
+  """
+  nonce_key = cast(bytes, HKDF(key, KEY_SIZE_BYTES, b'', SHA256, context=b'nonce'))
+  return cast(bytes, HKDF(
+      nonce_key,
+      NONCE_SIZE_BYTES,
+      str(key_revision).encode('utf-8'),
+      SHA256,
+      context=plaintext.encode('utf-8')
+    ))
+
 class EncryptedStringProvider(ResourceProvider):
   def _gen_outs(
         self,
@@ -36,7 +55,8 @@ class EncryptedStringProvider(ResourceProvider):
         input_key_b64: Optional[str],
         input_key_revision: Optional[int],
         old_key_b64: Optional[str]=None,
-        old_key_revision: int=0
+        old_key_revision: int=0,
+        deterministic_nonce: bool=False,
       ) -> JsonableDict:
     if _DEBUG_PROVIDER: pulumi.log.info(
         f"EncryptedStringProvider._gen_outs(name={name}, plaintext={' '.join(plaintext)}, "
@@ -44,12 +64,10 @@ class EncryptedStringProvider(ResourceProvider):
       )
     assert isinstance(name, str)
     assert input_key_b64 is None or isinstance(input_key_b64, str)
-    if isinstance(input_key_revision, float):
-      input_key_revision = round(input_key_revision)
+    input_key_revision = coerce_pulumi_int(input_key_revision)
     assert input_key_revision is None or isinstance(input_key_revision, int)
     assert old_key_b64 is None or isinstance(old_key_b64, str)
-    if isinstance(old_key_revision, float):
-      old_key_revision = round(old_key_revision)
+    old_key_revision = coerce_pulumi_int(old_key_revision)
     assert old_key_revision is None or isinstance(old_key_revision, int)
     if not input_key_b64 is None:
       key_b64 = input_key_b64
@@ -66,7 +84,7 @@ class EncryptedStringProvider(ResourceProvider):
       key_revision = input_key_revision
     if len(key) != KEY_SIZE_BYTES:
       raise ValueError(f"Wrong key size for EncryptedStringProvider, expected {KEY_SIZE_BYTES} bytes, got {len(key)}")
-    nonce = generate_nonce()
+    nonce = _derive_nonce(key, key_revision, plaintext) if deterministic_nonce else generate_nonce()
     if _DEBUG_PROVIDER: pulumi.log.info(
         f"EncryptedStringProvider._gen_outs(binary key={' '.join(str(key))}, nonce={' '.join(str(nonce))})")
     ciphertext = encrypt_string(plaintext, key, nonce=nonce)
@@ -79,6 +97,7 @@ class EncryptedStringProvider(ResourceProvider):
         key_revision=key_revision,
         plaintext=plaintext,
         ciphertext=ciphertext,
+        deterministic_nonce=deterministic_nonce,
       )
     return result
 
@@ -106,6 +125,7 @@ class EncryptedStringProvider(ResourceProvider):
       plaintext = cast(Optional[str], newRawInputs.get('plaintext', None))
       input_key_b64 = cast(Optional[str], newRawInputs.get('input_key_b64', None))
       input_key_revision = cast(Optional[int], newRawInputs.get("input_key_revision", None))
+      deterministic_nonce = cast(Optional[bool], newRawInputs.get("deterministic_nonce", False))
       if _DEBUG_PROVIDER: pulumi.log.info(f"EncryptedStringProvider.check(): plaintext={None if plaintext is None else ' '.join(str(plaintext))}")
       if not isinstance(name, str):
         failures.append(CheckFailure('name', f'name must be a string: {name}'))
@@ -125,15 +145,25 @@ class EncryptedStringProvider(ResourceProvider):
                   f"expected {KEY_SIZE_BYTES} bytes, got {len(input_key)}"))
           except Exception:
             failures.append(CheckFailure('input_key_b64', f"Invalid base-64 encoding"))
-      if isinstance(input_key_revision, float):
-        input_key_revision = round(input_key_revision)
+      input_key_revision = coerce_pulumi_int(input_key_revision)
       if not input_key_revision is None and not isinstance(input_key_revision, int):
         failures.append(CheckFailure('input_key_revision',
             f"Key revision number must be None or an integer, got "
             f"{full_type(input_key_revision)}: {input_key_revision}"))
+      if deterministic_nonce is None:
+        deterministic_nonce = False
+      if not isinstance(deterministic_nonce, bool):
+        failures.append(CheckFailure('deterministic_nonce',
+            f"deterministic_nonce must be a bool, got {full_type(deterministic_nonce)}: {deterministic_nonce}"))
 
       # Return a dict of inputs as they should be passed to diff, update, or create
-      inputs = dict(name=name, plaintext=plaintext, input_key_b64=input_key_b64, input_key_revision=input_key_revision)
+      inputs = dict(
+          name=name,
+          plaintext=plaintext,
+          input_key_b64=input_key_b64,
+          input_key_revision=input_key_revision,
+          deterministic_nonce=deterministic_nonce,
+        )
 
       if _DEBUG_PROVIDER: pulumi.log.info(f"EncryptedStringProvider.check() ==> CheckResult(inputs={inputs}, failures={failures})")
       return CheckResult(inputs, failures)
@@ -160,7 +190,8 @@ class EncryptedStringProvider(ResourceProvider):
       plaintext: str = newInputs['plaintext']
       key_b64: Optional[str] = newInputs.get('input_key_b64', None)
       key_revision: Optional[int] = newInputs.get('input_key_revision', None)
-      outs = self._gen_outs(rid, plaintext, key_b64, key_revision)
+      deterministic_nonce = cast(bool, newInputs.get('deterministic_nonce', False))
+      outs = self._gen_outs(rid, plaintext, key_b64, key_revision, deterministic_nonce=deterministic_nonce)
       if _DEBUG_PROVIDER: pulumi.log.info(f"EncryptedStringProvider.create() ==> CreateResult(id={rid}, outs={outs})")
       return CreateResult(rid, outs)
     except Exception:
@@ -186,13 +217,15 @@ class EncryptedStringProvider(ResourceProvider):
       input_key_revision: Optional[int] = newInputs.get('input_key_revision', None)
       old_key_b64: str = oldOutputs['key_b64']
       old_key_revision: int = oldOutputs.get('key_revision', 0)
+      deterministic_nonce = cast(bool, newInputs.get('deterministic_nonce', False))
       outs = self._gen_outs(
           rid,
           plaintext,
           key_b64,
           input_key_revision,
           old_key_b64,
-          old_key_revision
+          old_key_revision,
+          deterministic_nonce=deterministic_nonce,
         )
       if _DEBUG_PROVIDER: pulumi.log.info(f"EncryptedStringProvider.update() ==> UpdateResult(outs={outs})")
       return UpdateResult(outs)
@@ -225,18 +258,17 @@ class EncryptedStringProvider(ResourceProvider):
       plaintext_changes: bool = oldOutputs['plaintext'] != newInputs['plaintext']
       input_key_b64: Optional[str] = newInputs.get('input_key_b64', None)
       old_key_b64: str = oldOutputs['key_b64']
-      input_key_revision: Optional[int] = newInputs.get('input_key_revision', None)
-      if isinstance(input_key_revision, float):
-        input_key_revision = round(input_key_revision)
-      old_key_revision: int = oldOutputs.get('key_revision', 0)
-      if isinstance(old_key_revision, float):
-        old_key_revision = round(old_key_revision)
+      input_key_revision: Optional[int] = coerce_pulumi_int(newInputs.get('input_key_revision', None))
+      old_key_revision: int = coerce_pulumi_int(oldOutputs.get('key_revision', 0))
       key_revision_changes = not input_key_revision is None and input_key_revision != old_key_revision
       key_changes = key_revision_changes or (
           not input_key_b64 is None and input_key_b64 != old_key_b64
         )
       key_revision_changes = key_revision_changes or (input_key_revision is None and key_changes)
-      changes = plaintext_changes or key_changes or key_revision_changes
+      deterministic_nonce_changes = (
+          newInputs.get('deterministic_nonce', False) != oldOutputs.get('deterministic_nonce', False)
+        )
+      changes = plaintext_changes or key_changes or key_revision_changes or deterministic_nonce_changes
       stables.append('name')
       if not plaintext_changes:
         stables.append('plaintext')
@@ -244,6 +276,8 @@ class EncryptedStringProvider(ResourceProvider):
         stables.append('key_b64')
       if not key_revision_changes:
         stables.append('key_revision')
+      if not deterministic_nonce_changes:
+        stables.append('deterministic_nonce')
       if not changes:
         stables.append('ciphertext')
       if _DEBUG_PROVIDER: pulumi.log.info(f"EncryptedStringProvider.diff() ==> DiffResult(changes={changes}, replaces={replaces}, stables={stables})")
@@ -273,6 +307,9 @@ class EncryptedString(Resource):
   ciphertext: Output[str]
   """The encrypted ciphertext string"""
 
+  deterministic_nonce: Output[bool]
+  """True if the nonce is derived from the key, key revision and plaintext rather than randomly generated"""
+
   @property
   def key(self) -> Output[bytes]:
     return self.key_b64.apply(lambda x: b64decode(x))
@@ -283,6 +320,7 @@ class EncryptedString(Resource):
         plaintext: Input[str],
         key: Input[Optional[bytes]] = None,
         key_revision: Optional[int]=None,
+        deterministic_nonce: bool=False,
         opts: Optional[ResourceOptions] = None
       ):
     """Create an ecrypted string resource.
@@ -303,6 +341,11 @@ class EncryptedString(Resource):
                       An optional int identifying a revision number for the key.
                       If different that the existing revision, will force a new key
                       to be generated. If None, a new key will not be forced.
+        deterministic_nonce (bool):
+                      If True, the nonce is derived from the key, key revision and
+                      plaintext instead of being randomly generated, so that identical
+                      inputs produce identical ciphertext across previews and updates.
+                      Default is False.
         opts (Optional[ResourceOptions], optional): _description_.
                       Resource options. If None, a default set of options will
                       be generated. Defaults to None.
@@ -325,7 +368,8 @@ class EncryptedString(Resource):
             key_b64=None,
             ciphertext=None,
             input_key_revision=key_revision,
-            key_revision=None
+            key_revision=None,
+            deterministic_nonce=deterministic_nonce,
           ),
         opts=opts
       )
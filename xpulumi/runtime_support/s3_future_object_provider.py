@@ -1,7 +1,11 @@
 from ..internal_types import Jsonable, JsonableDict
 from ..util import split_s3_uri
 from typing import Any, Optional, List, cast
-import json
+
+try:
+  import orjson as _json
+except ImportError:
+  import json as _json  #type: ignore[no-redef]
 
 from pulumi.dynamic import ResourceProvider, CreateResult, Resource, DiffResult, UpdateResult, CheckResult, CheckFailure
 from pulumi import ResourceOptions, Input, Output
@@ -15,6 +19,14 @@ from ..s3_object_waiter import (
 
 _DEBUG_PROVIDER = False
 
+def _coerce_float(x: Any, default: float) -> Any:
+  """Replaces None with a default and converts an int to a float; returns other values unchanged"""
+  if x is None:
+    return default
+  if isinstance(x, int) and not isinstance(x, bool):
+    return float(x)
+  return x
+
 class S3FutureObjectProvider(ResourceProvider):
   def _gen_outs(self, props: JsonableDict) -> JsonableDict:
     if _DEBUG_PROVIDER: pulumi.log.info(f"S3FutureObjectProvider._gen_outs(props={props})")
@@ -42,19 +54,11 @@ class S3FutureObjectProvider(ResourceProvider):
     aws_region = newProps.get('aws_region', None)
     if aws_region is None:
       aws_region = 'us-east-1'
-    max_wait_seconds = newProps.get('max_wait_seconds', None)
-    if max_wait_seconds is None:
-      max_wait_seconds = DEFAULT_S3_OBJECT_WAIT_TIMEOUT_SECONDS
-    if isinstance(max_wait_seconds, int):
-      max_wait_seconds = float(max_wait_seconds)
-    poll_interval = newProps.get('poll_interval', None)
-    if poll_interval is None:
-      poll_interval = DEFAULT_S3_OBJECT_POLL_INTERVAL_SECONDS
-    if isinstance(poll_interval, int):
-      poll_interval = float(poll_interval)
+    max_wait_seconds = _coerce_float(newProps.get('max_wait_seconds', None), DEFAULT_S3_OBJECT_WAIT_TIMEOUT_SECONDS)
+    poll_interval = _coerce_float(newProps.get('poll_interval', None), DEFAULT_S3_OBJECT_POLL_INTERVAL_SECONDS)
 
     failures: List[CheckFailure] = []
-    if not isinstance(uri, pulumi.output.Unknown):
+    if not type(uri) is pulumi.output.Unknown:   # pylint: disable=unidiomatic-typecheck
       if not isinstance(uri, str):
         failures.append(CheckFailure('uri', f'uri must be a string: {uri}'))
       try:
@@ -137,5 +141,5 @@ class S3FutureObject(Resource):
       )
 
   def get_json_content(self) -> Output[Jsonable]:
-    result: Output[Jsonable] = self.content.apply(lambda x: None if x is None else json.loads(x))
+    result: Output[Jsonable] = self.content.apply(lambda x: None if x is None else _json.loads(x))
     return result
@@ -3,12 +3,21 @@ import pulumi
 #pulumi.info(f"Loading {__name__}")
 
 from ..internal_types import Jsonable, JsonableDict
-from ..util import split_s3_uri
-from typing import Any, Optional, List, cast, Tuple, TYPE_CHECKING
+from ..util import split_s3_uri, coerce_pulumi_int
+from typing import Any, Optional, List, Dict, Iterator, Mapping, cast, Tuple, TYPE_CHECKING
 import json
 import subprocess
 import os
 import socket
+import time
+import asyncio
+import fcntl
+import hmac
+import hashlib
+import binascii
+import contextlib
+import tempfile
+from base64 import b64decode
 
 from pulumi.dynamic import ResourceProvider, CreateResult, Resource, DiffResult, UpdateResult, CheckResult, CheckFailure
 from pulumi import ResourceOptions, Input, Output
@@ -18,6 +27,11 @@ if TYPE_CHECKING:
 
 _DEBUG_PROVIDER = False
 
+DEFAULT_SSH_KEYSCAN_TIMEOUT_SECONDS = 5
+
+# Properties that, if changed, require the host keys to be rescanned
+_REPLACE_PROPNAMES = ('instance_id', 'ip_address', 'dns_name')
+
 class CmdError(Exception):
   pass
 
@@ -30,50 +44,258 @@ def _run_cmd(args: List[str]) -> str:
     raise CmdError(f"SShCachedHostKey: {args} failed with exit code {exit_code}: {stdout_s}")
   return stdout_s
 
-def _run_cmd_separate(args: List[str]) -> Tuple[str, str]:
-  with subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE) as proc:
-    (stdout_bytes, stderr_bytes) = proc.communicate()
-    stdout_s = stdout_bytes.decode('utf-8')
-    stderr_s = stderr_bytes.decode('utf-8')
-    exit_code = proc.returncode
-  if exit_code != 0:
-    raise CmdError(f"SShCachedHostKey: {args} failed with exit code {exit_code}: {stderr_s}")
-  return stdout_s, stderr_s
+def _get_known_hosts_pathname() -> str:
+  return os.path.expanduser("~/.ssh/known_hosts")
+
+@contextlib.contextmanager
+def _known_hosts_lock() -> Iterator[None]:
+  """Holds an exclusive flock that serializes all updates to known_hosts.
+
+  The lock is taken on a sidecar file rather than on known_hosts itself, because
+  removing entries replaces known_hosts with a new inode.
+  """
+  lock_pathname = _get_known_hosts_pathname() + '.lock'
+  os.makedirs(os.path.dirname(lock_pathname), mode=0o700, exist_ok=True)
+  with open(lock_pathname, 'w', encoding='utf-8') as lock_file:
+    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+    try:
+      yield
+    finally:
+      fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+def _hashed_host_matches(hashed_host: str, name: str) -> bool:
+  """Returns True if a hashed known_hosts host field ("|1|<salt>|<hash>") is the hash of name"""
+  parts = hashed_host.split('|')
+  if len(parts) != 4:
+    raise ValueError(f"Unrecognized hashed known_hosts entry: {hashed_host}")
+  salt = b64decode(parts[2])
+  expected = b64decode(parts[3])
+  actual = hmac.new(salt, name.encode('utf-8'), hashlib.sha1).digest()
+  return hmac.compare_digest(actual, expected)
+
+def _find_matching_host(host_field: str, names: List[str]) -> Optional[str]:
+  """Returns the first of names that matches a known_hosts host field, or None if none match.
+
+  Like ssh-keygen, names are matched case-insensitively. Raises ValueError for a host field
+  that contains wildcard or negated patterns, which are left to ssh-keygen.
+  """
+  if host_field.startswith('|1|'):
+    for name in names:
+      if _hashed_host_matches(host_field, name.lower()):
+        return name
+    return None
+  if host_field.startswith('|'):
+    raise ValueError(f"Unrecognized hashed known_hosts entry: {host_field}")
+  hosts = host_field.lower().split(',')
+  for host in hosts:
+    if host.startswith('!') or '*' in host or '?' in host:
+      raise ValueError(f"Pattern in known_hosts entry: {host_field}")
+  for name in names:
+    if name.lower() in hosts:
+      return name
+  return None
+
+def _remove_entries_py(names: List[str]) -> Optional[str]:
+  """Removes all entries for any of a list of hosts from ~/.ssh/known_hosts in a single pass,
+     without running ssh-keygen. Must be called with _known_hosts_lock() held.
+
+  Returns:
+      Optional[str]: Log text similar to "ssh-keygen -R", or None if the file contains
+                     entries in a format that is not recognized (including text that is
+                     not valid UTF-8, and wildcard or negated host patterns), in which
+                     case the file is left unchanged.
+  """
+  known_hosts = _get_known_hosts_pathname()
+  try:
+    with open(known_hosts, encoding='utf-8') as f:
+      lines = f.readlines()
+  except FileNotFoundError:
+    return ''
+  except UnicodeDecodeError:
+    return None
+  result = ''
+  survivors: List[str] = []
+  for i, line in enumerate(lines):
+    fields = line.split()
+    # Like ssh-keygen, leave comments and @cert-authority/@revoked lines alone
+    if len(fields) == 0 or fields[0].startswith(('#', '@')):
+      survivors.append(line)
+      continue
+    try:
+      name = _find_matching_host(fields[0], names)
+    except (ValueError, binascii.Error):
+      return None
+    if not name is None:
+      result += f"# Host {name} found: line {i+1}\n"
+    else:
+      survivors.append(line)
+  if len(survivors) < len(lines):
+    mode = os.stat(known_hosts).st_mode & 0o777
+    fd, tmp_known_hosts = tempfile.mkstemp(dir=os.path.dirname(known_hosts), prefix='known_hosts.', suffix='.tmp')
+    try:
+      with open(fd, 'w', encoding='utf-8') as f:
+        os.fchmod(f.fileno(), mode)
+        f.writelines(survivors)
+      # Like ssh-keygen, keep the previous contents in known_hosts.old
+      old_known_hosts = known_hosts + '.old'
+      with contextlib.suppress(FileNotFoundError):
+        os.unlink(old_known_hosts)
+      os.link(known_hosts, old_known_hosts)
+      os.replace(tmp_known_hosts, known_hosts)
+    except BaseException:
+      os.unlink(tmp_known_hosts)
+      raise
+    result += f"{known_hosts} updated.\n"
+  return result
 
-def _remove_entry(name: str) -> str:
-  known_hosts = os.path.expanduser("~/.ssh/known_hosts")
-  result = _run_cmd(["ssh-keygen", "-f", known_hosts, "-R", name])
+def _remove_entries(names: List[str]) -> str:
+  with _known_hosts_lock():
+    result = _remove_entries_py(names)
+    if result is None:
+      known_hosts = _get_known_hosts_pathname()
+      result = ''
+      for name in names:
+        # "ssh-keygen -R" does not lower-case the name when matching hashed entries
+        result += _run_cmd(["ssh-keygen", "-f", known_hosts, "-R", name.lower()])
   return result
 
+def _append_entries(new_hosts: bytes) -> None:
+  """Appends raw known_hosts lines in a single write, serialized with all other updates"""
+  with _known_hosts_lock():
+    with open(_get_known_hosts_pathname(), 'ab') as f:
+      os.write(f.fileno(), new_hosts)
+
+_DNS_TTL: float = 900.0
+_DNS_CACHE: Dict[str, Tuple[float, str]] = {}
+
+def clear_dns_cache() -> None:
+  _DNS_CACHE.clear()
+
 def _get_ip_address_of_dns_name(dns_name: str) -> str:
+  now = time.monotonic()
+  entry = _DNS_CACHE.get(dns_name, None)
+  if not entry is None and now - entry[0] < _DNS_TTL:
+    return entry[1]
   result = socket.gethostbyname(dns_name)
+  _DNS_CACHE[dns_name] = (now, result)
   return result
 
-def _scan_hosts(hostname: str) -> Tuple[str, str]:
-  stdout_s, stderr_s = _run_cmd_separate(["ssh-keyscan", "-H", hostname])
-  return stdout_s, stderr_s
+async def _async_run_cmd_separate_bytes(args: List[str]) -> Tuple[bytes, bytes]:
+  proc = await asyncio.create_subprocess_exec(*args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+  (stdout_bytes, stderr_bytes) = await proc.communicate()
+  exit_code = proc.returncode
+  if exit_code != 0:
+    raise CmdError(f"SShCachedHostKey: {args} failed with exit code {exit_code}: {stderr_bytes.decode('utf-8', errors='replace')}")
+  return stdout_bytes, stderr_bytes
+
+async def _async_scan_hosts(hostnames: List[str], scan_timeout: int=DEFAULT_SSH_KEYSCAN_TIMEOUT_SECONDS) -> Tuple[bytes, str]:
+  """Returns the raw known_hosts lines produced by ssh-keyscan, and its decoded log text"""
+  stdout_bytes, stderr_bytes = await _async_run_cmd_separate_bytes(
+      ["ssh-keyscan", "-T", str(scan_timeout), "-t", "rsa,ecdsa,ed25519", "-H"] + hostnames
+    )
+  return stdout_bytes, stderr_bytes.decode('utf-8', errors='replace')
 
-def update_host_keys(ip_address: Optional[str]=None, dns_name: Optional[str] = None) -> str:
+async def _async_update_host_keys(
+      ip_address: Optional[str]=None,
+      dns_name: Optional[str] = None,
+      scan_timeout: int=DEFAULT_SSH_KEYSCAN_TIMEOUT_SECONDS,
+    ) -> str:
+  """Refreshes known_hosts entries for an SSH host.
+
+  ssh-keyscan (which waits for the remote SSH banner) runs concurrently with the DNS
+  lookup and the removal of stale known_hosts entries. If the DNS name resolves to an
+  IP address that was not already being scanned, it is scanned concurrently as well.
+  """
   result: str = ""
-  if not ip_address is None:
-    result += _remove_entry(ip_address)
+  targets: List[str] = []
+  for target in (dns_name, ip_address):
+    if not target is None and not target in targets:
+      targets.append(target)
+  if len(targets) == 0:
+    return result
+  loop = asyncio.get_event_loop()
+  scan_tasks = [ asyncio.ensure_future(_async_scan_hosts(list(targets), scan_timeout=scan_timeout)) ]
   if not dns_name is None:
-    result += _remove_entry(dns_name)
-    ip2 = _get_ip_address_of_dns_name(dns_name)
-    if ip2 != ip_address:
-      result += _remove_entry(ip2)
-  hostname = dns_name if not dns_name is None else ip_address
-  if not hostname is None:
-    new_hosts, log_text = _scan_hosts(hostname)
+    ip2 = await loop.run_in_executor(None, _get_ip_address_of_dns_name, dns_name)
+    if not ip2 in targets:
+      targets.append(ip2)
+      scan_tasks.append(asyncio.ensure_future(_async_scan_hosts([ip2], scan_timeout=scan_timeout)))
+  result += await loop.run_in_executor(None, _remove_entries, targets)
+  scan_results = await asyncio.gather(*scan_tasks)
+  new_hosts = b''
+  for scanned_hosts, log_text in scan_results:
     result += log_text
-    if len(new_hosts) > 0:
-      known_hosts = os.path.expanduser("~/.ssh/known_hosts")
-      if not new_hosts.endswith('\n'):
-        new_hosts += '\n'
-      with open(known_hosts, 'a', encoding='utf-8') as f:
-        f.write(new_hosts)
+    if len(scanned_hosts) > 0 and not scanned_hosts.endswith(b'\n'):
+      scanned_hosts += b'\n'
+    new_hosts += scanned_hosts
+  if len(new_hosts) > 0:
+    await loop.run_in_executor(None, _append_entries, new_hosts)
+  return result
+
+def update_host_keys(
+      ip_address: Optional[str]=None,
+      dns_name: Optional[str] = None,
+      scan_timeout: int=DEFAULT_SSH_KEYSCAN_TIMEOUT_SECONDS,
+    ) -> str:
+  result = asyncio.run(_async_update_host_keys(ip_address=ip_address, dns_name=dns_name, scan_timeout=scan_timeout))
   return result
 
+_HOSTKEY_CACHE_TTL: float = 3600.0
+
+def _get_hostkey_cache_pathname() -> str:
+  return os.path.join(os.path.expanduser('~'), '.cache', 'xpulumi', 'hostkey-cache.json')
+
+def _load_hostkey_cache() -> JsonableDict:
+  try:
+    with open(_get_hostkey_cache_pathname(), encoding='utf-8') as f:
+      cache = json.load(f)
+  except (FileNotFoundError, json.JSONDecodeError):
+    return {}
+  if not isinstance(cache, dict):
+    return {}
+  return cache
+
+def _save_hostkey_cache(cache: Mapping[str, Jsonable]) -> None:
+  cache_file = _get_hostkey_cache_pathname()
+  tmp_cache_file = cache_file + '.tmp'
+  with open(tmp_cache_file, 'w', encoding='utf-8') as f:
+    json.dump(cache, f)
+  os.replace(tmp_cache_file, cache_file)
+
+def _is_fresh_cache_entry(entry: Jsonable, now: float) -> bool:
+  """Returns True if a hostkey cache entry is well formed and was written within
+     _HOSTKEY_CACHE_TTL seconds. Malformed (e.g., hand-edited) entries count as misses."""
+  if not isinstance(entry, dict):
+    return False
+  ts = entry.get('ts', None)
+  if not isinstance(ts, (int, float)) or isinstance(ts, bool):
+    return False
+  return now - ts < _HOSTKEY_CACHE_TTL and isinstance(entry.get('cmd_out', None), str)
+
+def _get_cached_host_keys_log(cache_key: str) -> Optional[str]:
+  """Returns the update_host_keys() log text for a recently scanned host, or None if it
+     has not been scanned within _HOSTKEY_CACHE_TTL seconds."""
+  entry = _load_hostkey_cache().get(cache_key, None)
+  if _is_fresh_cache_entry(entry, time.time()):
+    return cast(str, cast(JsonableDict, entry)['cmd_out'])
+  return None
+
+def _put_cached_host_keys_log(cache_key: str, log_text: str) -> None:
+  cache_file = _get_hostkey_cache_pathname()
+  os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+  with open(cache_file + '.lock', 'w', encoding='utf-8') as lock_file:
+    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+    try:
+      now = time.time()
+      cache: Dict[str, JsonableDict] = dict(
+          (k, cast(JsonableDict, v)) for k, v in _load_hostkey_cache().items()
+            if _is_fresh_cache_entry(v, now)
+        )
+      cache[cache_key] = {'ts': now, 'cmd_out': log_text}
+      _save_hostkey_cache(cache)
+    finally:
+      fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
 class SshCachedHostKeyProvider(ResourceProvider):
   def _gen_outs(self, props: JsonableDict) -> JsonableDict:
     if _DEBUG_PROVIDER: pulumi.log.info(f"SshCachedHostKeyProvider._gen_outs(props={props})")
@@ -81,14 +303,21 @@ class SshCachedHostKeyProvider(ResourceProvider):
     instance_id = cast(str, props['instance_id'])
     ip_address = cast(Optional[str], props.get('ip_address', None))
     dns_name = cast(Optional[str], props.get('dns_name', None))
+    scan_timeout = cast(int, coerce_pulumi_int(props.get('scan_timeout', DEFAULT_SSH_KEYSCAN_TIMEOUT_SECONDS)))
 
-    log_text = update_host_keys(ip_address=ip_address, dns_name=dns_name)
+    # Skip the (slow) scan if this exact host was scanned recently, e.g., by another stack
+    cache_key = f"{instance_id}|{ip_address}|{dns_name}"
+    log_text = _get_cached_host_keys_log(cache_key)
+    if log_text is None:
+      log_text = update_host_keys(ip_address=ip_address, dns_name=dns_name, scan_timeout=scan_timeout)
+      _put_cached_host_keys_log(cache_key, log_text)
     if _DEBUG_PROVIDER: pulumi.log.info(f"SshCachedHostKey: cmd output={log_text}")
 
     result: JsonableDict = dict(
         instance_id = instance_id,
         ip_address = ip_address,
         dns_name = dns_name,
+        scan_timeout = scan_timeout,
         cmd_out=log_text
       )
     return result
@@ -98,6 +327,9 @@ class SshCachedHostKeyProvider(ResourceProvider):
     instance_id = newProps.get('instance_id', None)
     ip_address = newProps.get('ip_address', None)
     dns_name = newProps.get('dns_name', None)
+    scan_timeout = coerce_pulumi_int(newProps.get('scan_timeout', None))
+    if scan_timeout is None:
+      scan_timeout = DEFAULT_SSH_KEYSCAN_TIMEOUT_SECONDS
 
     failures: List[CheckFailure] = []
     if not isinstance(instance_id, pulumi.output.Unknown):
@@ -109,7 +341,9 @@ class SshCachedHostKeyProvider(ResourceProvider):
     if not isinstance(dns_name, pulumi.output.Unknown):
       if not dns_name is None and not isinstance(dns_name, str):
         failures.append(CheckFailure('dns_name', f'dns_name must be None or a string: {dns_name}'))
-    inputs = dict(instance_id=instance_id, ip_address=ip_address, dns_name=dns_name)
+    if isinstance(scan_timeout, bool) or not isinstance(scan_timeout, int) or scan_timeout <= 0:
+      failures.append(CheckFailure('scan_timeout', f'scan_timeout must be None or a positive integer: {scan_timeout}'))
+    inputs = dict(instance_id=instance_id, ip_address=ip_address, dns_name=dns_name, scan_timeout=scan_timeout)
 
     if _DEBUG_PROVIDER: pulumi.log.info(f"SshCachedHostKeyProvider.check() ==> CheckResult(inputs={inputs}, failures={failures})")
     return CheckResult(inputs, failures)
@@ -148,15 +382,21 @@ class SshCachedHostKeyProvider(ResourceProvider):
       if _DEBUG_PROVIDER: pulumi.log.info(f"SshCachedHostKeyProvider.diff(id={id}, oldProps={oldProps}, newProps={newProps})")
       replaces: List[str] = []
       stables: List[str] = []
-      for propname in ['instance_id', 'ip_address', 'dns_name']:
-        if oldProps.get(propname, None) != newProps.get(propname, None):
-          if _DEBUG_PROVIDER: pulumi.log.info(f"SshCachedHostKeyProvider.diff() : {propname}: {oldProps.get(propname, None)} != {newProps.get(propname, None)}")
-          replaces.append(propname)
+      old_values = tuple(oldProps.get(propname, None) for propname in _REPLACE_PROPNAMES)
+      new_values = tuple(newProps.get(propname, None) for propname in _REPLACE_PROPNAMES)
+      if old_values != new_values:
+        for propname, old_value, new_value in zip(_REPLACE_PROPNAMES, old_values, new_values):
+          if old_value != new_value:
+            if _DEBUG_PROVIDER: pulumi.log.info(f"SshCachedHostKeyProvider.diff() : {propname}: {old_value} != {new_value}")
+            replaces.append(propname)
       changes = len(replaces) > 0
       if changes:
         replaces.append('cmd_out')
       else:
         stables.append('cmd_out')
+      # A different scan_timeout does not change the scanned host keys, so it does not force a rescan
+      if oldProps.get('scan_timeout', None) == newProps.get('scan_timeout', None):
+        stables.append('scan_timeout')
       if _DEBUG_PROVIDER: pulumi.log.info(f"SshCachedHostKeyProvider.diff() ==> DiffResult(changes={changes}, replaces={replaces}, stables={stables})")
     except Exception as e:
       if _DEBUG_PROVIDER: pulumi.log.warn(f"SshCachedHostKeyProvider.diff() ==> Exception: {repr(e)}")
@@ -167,6 +407,7 @@ class SshCachedHostKey(Resource):
   instance_id: Output[str]
   ip_address: Output[Optional[str]]
   dns_name: Output[Optional[str]]
+  scan_timeout: Output[int]
   cloudinit_result_str: Output[str]
   cmd_out: Output[str]
 
@@ -177,6 +418,7 @@ class SshCachedHostKey(Resource):
         ip_address: Input[Optional[str]]=None,
         dns_name: Input[Optional[str]]=None,
         cloudinit_result: Optional['S3FutureObject']=None,
+        scan_timeout: int=DEFAULT_SSH_KEYSCAN_TIMEOUT_SECONDS,
         opts: Optional[ResourceOptions]=None,
       ):
 
@@ -188,6 +430,7 @@ class SshCachedHostKey(Resource):
             instance_id=instance_id,
             ip_address=ip_address,
             dns_name=dns_name,
+            scan_timeout=scan_timeout,
             cloudinit_result_str='None' if cloudinit_result is None else cloudinit_result.content,
             cmd_out=None,
           ),
@@ -7,27 +7,95 @@
 
 """Functions to wait for S3 objects"""
 
-from typing import Optional, Tuple
+from typing import Optional, Tuple, Dict, List, Any
 
 import boto3.session
 import botocore.client
+import botocore.config
 import botocore.errorfactory
+import os
 import time
+import random
 import asyncio
 import concurrent.futures
+import threading
 
 from xpulumi.exceptions import XPulumiError
 
 from .util import split_s3_uri
 from project_init_tools import run_once
 
+DEFAULT_S3_WAITER_WORKERS = 16
+
 @run_once
 def get_executor() -> concurrent.futures.ThreadPoolExecutor:
-  executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+  max_workers = int(os.environ.get('XPULUMI_S3_WAITER_WORKERS', str(DEFAULT_S3_WAITER_WORKERS)))
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
   return executor
 
 DEFAULT_S3_OBJECT_WAIT_TIMEOUT_SECONDS: float = 10.0*60
 DEFAULT_S3_OBJECT_POLL_INTERVAL_SECONDS: float = 5.0
+DEFAULT_S3_OBJECT_HEDGE_DELAY_SECONDS: float = 0.5
+
+_INITIAL_BACKOFF_SECONDS: float = 0.25
+_GET_OBJECT_CHUNK_SIZE = 1 << 20
+
+# Without s3:ListBucket permission on the bucket, HeadObject reports a missing key as 403
+# rather than 404, so access-denied errors are also treated as "not there yet"
+_NOT_FOUND_ERROR_CODES = frozenset(('404', 'NoSuchKey', 'NotFound', '403', 'AccessDenied', 'Forbidden'))
+_THROTTLING_ERROR_CODES = frozenset(('SlowDown', '503', 'ThrottlingException'))
+
+# In-flight waits are only shared between callers that pass identical arguments, since the
+# session, region, timeout and polling parameters all affect the result a caller sees
+_InflightKey = Tuple[str, str, Optional[boto3.session.Session], Optional[str], float, float, float]
+
+class _AsyncInflightWait:
+  """A shared in-flight async wait, and the number of callers currently awaiting it"""
+  task: 'asyncio.Future[bytes]'
+  n_waiters: int
+
+  def __init__(self, task: 'asyncio.Future[bytes]'):
+    self.task = task
+    self.n_waiters = 0
+
+_INFLIGHT: Dict[_InflightKey, concurrent.futures.Future] = {}
+_INFLIGHT_LOCK = threading.Lock()
+_ASYNC_INFLIGHT: Dict[Tuple[asyncio.AbstractEventLoop, _InflightKey], _AsyncInflightWait] = {}
+
+_CLIENT_CACHE: Dict[Optional[str], botocore.client.BaseClient] = {}
+_CLIENT_LOCK = threading.Lock()
+
+def _get_s3_client(region_name: Optional[str]=None) -> botocore.client.BaseClient:
+  """Returns a process-wide cached S3 client for the given region, creating it on first use.
+
+  boto3 clients are thread-safe, and creating them is expensive (service model loading,
+  endpoint resolution), so a single client is shared per region. Its connection pool is
+  sized for concurrent waiters and uses TCP keepalive so that repeated polls reuse
+  connections.
+  """
+  with _CLIENT_LOCK:
+    bcs3 = _CLIENT_CACHE.get(region_name, None)
+    if bcs3 is None:
+      sess = boto3.session.Session(region_name=region_name)
+      bcs3 = sess.client(
+          's3',
+          config=botocore.config.Config(
+              max_pool_connections=32,
+              tcp_keepalive=True,
+              retries={'mode': 'adaptive', 'max_attempts': 10},
+            )
+        )
+      _CLIENT_CACHE[region_name] = bcs3
+  return bcs3
+
+def _get_s3_client_for_session(
+      sess: Optional[boto3.session.Session]=None,
+      region_name: Optional[str]=None,
+    ) -> botocore.client.BaseClient:
+  """Returns an S3 client for a caller-provided session, or the shared cached client for region_name"""
+  if sess is None:
+    return _get_s3_client(region_name)
+  return sess.client('s3')
 
 def _normalize_bucket_key(
       uri: Optional[str]=None,
@@ -42,6 +110,170 @@ def _normalize_bucket_key(
     raise XPulumiError("An S3 key name or S3 object URI is required")
   return bucket, key
 
+def _is_throttling_poll_error(bucket: str, key: str, e: botocore.errorfactory.ClientError) -> bool:
+  """Classifies a ClientError raised while polling for an S3 object.
+
+  A 403 is treated the same as a 404, since S3 returns 403 for a missing key when the
+  caller lacks s3:ListBucket on the bucket. A genuine lack of s3:GetObject permission
+  therefore waits until max_wait_seconds elapses.
+
+  Returns:
+      bool: True if the request was throttled, False if the object does not exist yet.
+
+  Raises:
+      XPulumiError: The error is not recoverable by waiting (e.g., wrong region or no such bucket)
+  """
+  code = e.response.get('Error', {}).get('Code', '')
+  if code in _NOT_FOUND_ERROR_CODES:
+    return False
+  if code in _THROTTLING_ERROR_CODES:
+    return True
+  raise XPulumiError(f"Unable to wait for s3://{bucket}/{key} to exist: {e}") from e
+
+def _backoff_wait_seconds(
+      bucket: str,
+      key: str,
+      backoff: float,
+      start_time: float,
+      max_wait_seconds: float,
+      poll_interval: float,
+    ) -> float:
+  """Returns a jittered number of seconds to wait before the next poll, capped at poll_interval
+     and at the time remaining before max_wait_seconds elapses.
+
+  Raises:
+      TimeoutError: max_wait_seconds has already elapsed
+  """
+  wait_seconds = min(backoff, poll_interval) * (0.5 + random.random() * 0.5)
+  if max_wait_seconds >= 0:
+    elapsed = time.monotonic() - start_time
+    if elapsed > max_wait_seconds:
+      raise TimeoutError(f"Timed out waiting for s3://{bucket}/{key} to exist")
+    wait_seconds = min(wait_seconds, max_wait_seconds - elapsed)
+  return wait_seconds
+
+def _poll_s3_object(
+      bcs3: botocore.client.BaseClient,
+      bucket: str,
+      key: str,
+      max_wait_seconds: float=DEFAULT_S3_OBJECT_WAIT_TIMEOUT_SECONDS,
+      poll_interval: float = DEFAULT_S3_OBJECT_POLL_INTERVAL_SECONDS,
+    ) -> None:
+  """Waits for an S3 object to exist, polling with exponential backoff up to poll_interval"""
+  start_time = time.monotonic()
+  backoff = _INITIAL_BACKOFF_SECONDS
+  while True:
+    try:
+      bcs3.head_object(Bucket=bucket, Key=key)
+      return
+    except botocore.errorfactory.ClientError as e:
+      if _is_throttling_poll_error(bucket, key, e):
+        backoff = min(backoff * 4, poll_interval)
+    wait_seconds = _backoff_wait_seconds(bucket, key, backoff, start_time, max_wait_seconds, poll_interval)
+    backoff = min(backoff * 2, poll_interval)
+    if wait_seconds > 0:
+      time.sleep(wait_seconds)
+
+async def _async_poll_s3_object(
+      bcs3: botocore.client.BaseClient,
+      bucket: str,
+      key: str,
+      max_wait_seconds: float=DEFAULT_S3_OBJECT_WAIT_TIMEOUT_SECONDS,
+      poll_interval: float = DEFAULT_S3_OBJECT_POLL_INTERVAL_SECONDS,
+    ) -> None:
+  """Asynchronously waits for an S3 object to exist, polling with exponential backoff up to poll_interval"""
+  start_time = time.monotonic()
+  backoff = _INITIAL_BACKOFF_SECONDS
+  loop = asyncio.get_event_loop()
+  executor = get_executor()
+  while True:
+    try:
+      await loop.run_in_executor(executor, lambda: bcs3.head_object(Bucket=bucket, Key=key))
+      return
+    except botocore.errorfactory.ClientError as e:
+      if _is_throttling_poll_error(bucket, key, e):
+        backoff = min(backoff * 4, poll_interval)
+    wait_seconds = _backoff_wait_seconds(bucket, key, backoff, start_time, max_wait_seconds, poll_interval)
+    backoff = min(backoff * 2, poll_interval)
+    if wait_seconds > 0:
+      await asyncio.sleep(wait_seconds)
+
+def _read_response_body(resp: Any) -> bytes:
+  """Reads the entire body of a get_object response in a single blocking call"""
+  buf = bytearray()
+  for chunk in resp['Body'].iter_chunks(chunk_size=_GET_OBJECT_CHUNK_SIZE):
+    buf.extend(chunk)
+  return bytes(buf)
+
+def _close_response_body(future: concurrent.futures.Future) -> None:
+  """Done-callback for a losing hedged get_object; returns its connection to the pool"""
+  if not future.cancelled() and future.exception() is None:
+    future.result()['Body'].close()
+
+def _discard_async_result(future: asyncio.Future) -> None:
+  """Done-callback that marks an asyncio future's exception as retrieved"""
+  if not future.cancelled():
+    future.exception()
+
+def _wrap_hedged_future(future: concurrent.futures.Future) -> asyncio.Future:
+  """Wraps a hedged get_object future for asyncio.wait. The outcome is always read from
+     the concurrent future, so the wrapper's exception is marked as retrieved up front;
+     otherwise a failed request logs "Future exception was never retrieved"."""
+  async_future = asyncio.wrap_future(future)
+  async_future.add_done_callback(_discard_async_result)
+  return async_future
+
+def _settle_hedged_get_object(
+      futures: List[concurrent.futures.Future],
+      winner: concurrent.futures.Future,
+    ) -> Any:
+  """Abandons all but the winning hedged get_object, and returns the winner's response"""
+  for future in futures:
+    if not future is winner and not future.cancel():
+      future.add_done_callback(_close_response_body)
+  return winner.result()
+
+def _sync_hedged_get_object(
+      bcs3: botocore.client.BaseClient,
+      bucket: str,
+      key: str,
+      hedge_delay: float=DEFAULT_S3_OBJECT_HEDGE_DELAY_SECONDS,
+    ) -> bytes:
+  """Gets the content of an S3 object, issuing a duplicate request if the first one
+     has not returned response headers within hedge_delay seconds, and reading the
+     body of whichever responds first."""
+  executor = get_executor()
+  futures = [ executor.submit(bcs3.get_object, Bucket=bucket, Key=key) ]
+  done, _ = concurrent.futures.wait(futures, timeout=hedge_delay)
+  if len(done) == 0:
+    futures.append(executor.submit(bcs3.get_object, Bucket=bucket, Key=key))
+    done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+  resp = _settle_hedged_get_object(futures, next(iter(done)))
+  return _read_response_body(resp)
+
+async def _async_hedged_get_object(
+      bcs3: botocore.client.BaseClient,
+      bucket: str,
+      key: str,
+      hedge_delay: float=DEFAULT_S3_OBJECT_HEDGE_DELAY_SECONDS,
+    ) -> bytes:
+  """Asynchronously gets the content of an S3 object, issuing a duplicate request if the first one
+     has not returned response headers within hedge_delay seconds, and reading the body of
+     whichever responds first."""
+  loop = asyncio.get_event_loop()
+  executor = get_executor()
+  futures = [ executor.submit(bcs3.get_object, Bucket=bucket, Key=key) ]
+  async_futures = [ _wrap_hedged_future(futures[0]) ]
+  done, _ = await asyncio.wait(async_futures, timeout=hedge_delay)
+  if len(done) == 0:
+    futures.append(executor.submit(bcs3.get_object, Bucket=bucket, Key=key))
+    async_futures.append(_wrap_hedged_future(futures[1]))
+    await asyncio.wait(async_futures, return_when=asyncio.FIRST_COMPLETED)
+  winner = next(f for f in futures if f.done())
+  resp = _settle_hedged_get_object(futures, winner)
+  result: bytes = await loop.run_in_executor(executor, _read_response_body, resp)
+  return result
+
 def sync_wait_s3_object(
       uri: Optional[str]=None,
       bucket: Optional[str]=None,
@@ -62,31 +294,17 @@ def sync_wait_s3_object(
       max_wait_seconds (float, optional): The maximum number of seconds to wait before raising
                                            TimeoutError. if negative, will wait forever.
                                            Defaults to DEFAULT_S3_OBJECT_WAIT_TIMEOUT_SECONDS.
-      poll_interval (float, optional): The number of seconds between S3 queries.
+      poll_interval (float, optional): The maximum number of seconds between S3 queries.
                                            Defaults to DEFAULT_S3_OBJECT_POLL_INTERVAL_SECONDS.
   Raises:
-      TimeoutError: The S# object did not appear before max_wait_seconds elapsed
+      TimeoutError: The S# object did not appear before max_wait_seconds elapsed. Access denied (403) is
+                    treated as not yet existing, since that is how S3 reports a missing key to callers
+                    without s3:ListBucket permission.
+      XPulumiError: Polling failed with an error that waiting cannot fix (e.g., wrong region)
   """
   bucket, key = _normalize_bucket_key(uri, bucket, key)
-  start_time = time.monotonic()
-  if sess is None:
-    sess = boto3.session.Session(region_name=region_name)
-  bcs3 = sess.client('s3')
-  while True:
-    try:
-      bcs3.head_object(Bucket=bucket, Key=key)
-      return
-    except botocore.errorfactory.ClientError:
-      pass
-    if max_wait_seconds < 0:
-      wait_seconds = poll_interval
-    else:
-      elapsed = time.monotonic() - start_time
-      if elapsed > max_wait_seconds:
-        raise TimeoutError(f"Timed out waiting for s3://{bucket}/{key} to exist")
-      wait_seconds = min(poll_interval, max_wait_seconds - elapsed)
-    if wait_seconds > 0:
-      time.sleep(wait_seconds)
+  bcs3 = _get_s3_client_for_session(sess, region_name)
+  _poll_s3_object(bcs3, bucket, key, max_wait_seconds=max_wait_seconds, poll_interval=poll_interval)
 
 async def async_wait_s3_object(
       uri: Optional[str]=None,
@@ -98,28 +316,8 @@ async def async_wait_s3_object(
       poll_interval: float = DEFAULT_S3_OBJECT_POLL_INTERVAL_SECONDS,
     ) -> None:
   nbucket, nkey = _normalize_bucket_key(uri, bucket, key)
-  start_time = time.monotonic()
-  if sess is None:
-    sess = boto3.session.Session(region_name=region_name)
-  bcs3 = sess.client('s3')
-  loop = asyncio.get_event_loop()
-  executor = get_executor()
-  while True:
-    try:
-      task = loop.run_in_executor(executor, lambda: bcs3.head_object(Bucket=nbucket, Key=nkey))
-      await task
-      return
-    except botocore.errorfactory.ClientError:
-      pass
-    if max_wait_seconds < 0:
-      wait_seconds = poll_interval
-    else:
-      elapsed = time.monotonic() - start_time
-      if elapsed > max_wait_seconds:
-        raise TimeoutError(f"Timed out waiting for s3://{nbucket}/{nkey} to exist")
-      wait_seconds = min(poll_interval, max_wait_seconds - elapsed)
-    if wait_seconds > 0:
-      await asyncio.sleep(wait_seconds)
+  bcs3 = _get_s3_client_for_session(sess, region_name)
+  await _async_poll_s3_object(bcs3, nbucket, nkey, max_wait_seconds=max_wait_seconds, poll_interval=poll_interval)
 
 def sync_wait_and_get_s3_object(
       uri: Optional[str]=None,
@@ -129,6 +327,7 @@ def sync_wait_and_get_s3_object(
       region_name: Optional[str]=None,
       max_wait_seconds: float=DEFAULT_S3_OBJECT_WAIT_TIMEOUT_SECONDS, # -1 for infinite wait
       poll_interval: float = DEFAULT_S3_OBJECT_POLL_INTERVAL_SECONDS,
+      hedge_delay: float = DEFAULT_S3_OBJECT_HEDGE_DELAY_SECONDS,
     ) -> bytes:
   """Wait for an S3 object to exist, and return its content
 
@@ -140,29 +339,57 @@ def sync_wait_and_get_s3_object(
       max_wait_seconds (float, optional): The maximum number of seconds to wait before raising
                                            TimeoutError. if negative, will wait forever.
                                            Defaults to DEFAULT_S3_OBJECT_WAIT_TIMEOUT_SECONDS.
-      poll_interval (float, optional): The number of seconds between S3 queries.
+      poll_interval (float, optional): The maximum number of seconds between S3 queries.
                                            Defaults to DEFAULT_S3_OBJECT_POLL_INTERVAL_SECONDS.
+      hedge_delay (float, optional): The number of seconds to wait for the final get_object to return
+                                           response headers before issuing a duplicate request and reading
+                                           whichever responds first. Defaults to DEFAULT_S3_OBJECT_HEDGE_DELAY_SECONDS.
 
   Returns:
       bytes:  The content of the S3 object
 
   Raises:
-      TimeoutError: The S# object did not appear before max_wait_seconds elapsed
+      TimeoutError: The S# object did not appear before max_wait_seconds elapsed. Access denied (403) is
+                    treated as not yet existing, since that is how S3 reports a missing key to callers
+                    without s3:ListBucket permission.
+      XPulumiError: Polling failed with an error that waiting cannot fix (e.g., wrong region)
   """
   bucket, key = _normalize_bucket_key(uri, bucket, key)
-  if sess is None:
-    sess = boto3.session.Session(region_name=region_name)
-  bcs3 = sess.client('s3')
-  sync_wait_s3_object(
-      bucket=bucket,
-      key=key,
-      sess=sess,
-      region_name=region_name,
-      max_wait_seconds=max_wait_seconds,
-      poll_interval=poll_interval
-      )
-  resp = bcs3.get_object(Bucket=bucket, Key=key)
-  result = resp['Body'].read()
+  # If another thread is already waiting for the same object with the same arguments, share its result
+  inflight_key: _InflightKey = (bucket, key, sess, region_name, max_wait_seconds, poll_interval, hedge_delay)
+  with _INFLIGHT_LOCK:
+    future = _INFLIGHT.get(inflight_key, None)
+    is_leader = future is None
+    if future is None:
+      future = concurrent.futures.Future()
+      _INFLIGHT[inflight_key] = future
+  if not is_leader:
+    return future.result()
+  try:
+    bcs3 = _get_s3_client_for_session(sess, region_name)
+    _poll_s3_object(bcs3, bucket, key, max_wait_seconds=max_wait_seconds, poll_interval=poll_interval)
+    result = _sync_hedged_get_object(bcs3, bucket, key, hedge_delay=hedge_delay)
+    future.set_result(result)
+  except BaseException as e:
+    future.set_exception(e)
+    raise
+  finally:
+    with _INFLIGHT_LOCK:
+      del _INFLIGHT[inflight_key]
+  return result
+
+async def _async_wait_and_get_s3_object(
+      bucket: str,
+      key: str,
+      sess: Optional[boto3.session.Session],
+      region_name: Optional[str],
+      max_wait_seconds: float,
+      poll_interval: float,
+      hedge_delay: float,
+    ) -> bytes:
+  bcs3 = _get_s3_client_for_session(sess, region_name)
+  await _async_poll_s3_object(bcs3, bucket, key, max_wait_seconds=max_wait_seconds, poll_interval=poll_interval)
+  result = await _async_hedged_get_object(bcs3, bucket, key, hedge_delay=hedge_delay)
   return result
 
 async def async_wait_and_get_s3_object(
@@ -173,6 +400,7 @@ async def async_wait_and_get_s3_object(
       region_name: Optional[str]=None,
       max_wait_seconds: float=DEFAULT_S3_OBJECT_WAIT_TIMEOUT_SECONDS, # -1 for infinite wait
       poll_interval: float = DEFAULT_S3_OBJECT_POLL_INTERVAL_SECONDS,
+      hedge_delay: float = DEFAULT_S3_OBJECT_HEDGE_DELAY_SECONDS,
     ) -> bytes:
   """Wait for an S3 object to exist, and return its content
 
@@ -184,29 +412,46 @@ async def async_wait_and_get_s3_object(
       max_wait_seconds (float, optional): The maximum number of seconds to wait before raising
                                            TimeoutError. if negative, will wait forever.
                                            Defaults to DEFAULT_S3_OBJECT_WAIT_TIMEOUT_SECONDS.
-      poll_interval (float, optional): The number of seconds between S3 queries.
+      poll_interval (float, optional): The maximum number of seconds between S3 queries.
                                            Defaults to DEFAULT_S3_OBJECT_POLL_INTERVAL_SECONDS.
+      hedge_delay (float, optional): The number of seconds to wait for the final get_object to return
+                                           response headers before issuing a duplicate request and reading
+                                           whichever responds first. Defaults to DEFAULT_S3_OBJECT_HEDGE_DELAY_SECONDS.
 
   Returns:
       bytes:  The content of the S3 object
 
   Raises:
-      TimeoutError: The S# object did not appear before max_wait_seconds elapsed
+      TimeoutError: The S# object did not appear before max_wait_seconds elapsed. Access denied (403) is
+                    treated as not yet existing, since that is how S3 reports a missing key to callers
+                    without s3:ListBucket permission.
+      XPulumiError: Polling failed with an error that waiting cannot fix (e.g., wrong region)
   """
   nbucket, nkey = _normalize_bucket_key(uri, bucket, key)
-  if sess is None:
-    sess = boto3.session.Session(region_name=region_name)
-  bcs3 = sess.client('s3')
-  await async_wait_s3_object(
-      bucket=nbucket,
-      key=nkey,
-      sess=sess,
-      region_name=region_name,
-      max_wait_seconds=max_wait_seconds,
-      poll_interval=poll_interval
-      )
+  # If another task on this event loop is already waiting for the same object with the same
+  # arguments, share its result. The wait runs in its own task, so cancelling any one caller
+  # (including the one that started it) does not cancel it for the others.
   loop = asyncio.get_event_loop()
-  executor = get_executor()
-  resp = await loop.run_in_executor(executor, lambda: bcs3.get_object(Bucket=nbucket, Key=nkey))
-  result = await loop.run_in_executor(executor, lambda: resp['Body'].read())   # pylint: disable=unnecessary-lambda
+  inflight_key = (loop, (nbucket, nkey, sess, region_name, max_wait_seconds, poll_interval, hedge_delay))
+  inflight = _ASYNC_INFLIGHT.get(inflight_key, None)
+  if inflight is None:
+    new_inflight = _AsyncInflightWait(asyncio.ensure_future(_async_wait_and_get_s3_object(
+        nbucket, nkey, sess, region_name, max_wait_seconds, poll_interval, hedge_delay
+      )))
+    def remove_inflight(_: 'asyncio.Future[bytes]') -> None:
+      if _ASYNC_INFLIGHT.get(inflight_key, None) is new_inflight:
+        del _ASYNC_INFLIGHT[inflight_key]
+    new_inflight.task.add_done_callback(remove_inflight)
+    _ASYNC_INFLIGHT[inflight_key] = new_inflight
+    inflight = new_inflight
+  inflight.n_waiters += 1
+  try:
+    result = await asyncio.shield(inflight.task)
+  except asyncio.CancelledError:
+    # Only abandon the shared wait if no other caller is still waiting for it
+    if inflight.n_waiters == 1:
+      inflight.task.cancel()
+    raise
+  finally:
+    inflight.n_waiters -= 1
   return result
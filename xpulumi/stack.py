@@ -10,21 +10,19 @@ Allows the application to work with a particular Pulumi stack configuration.
 
 """
 
-from typing import Optional, cast, Dict, Tuple, Union, List, Set, Mapping
+from typing import Optional, cast, Dict, Tuple, Union, List, Set, Mapping, Callable
 from .internal_types import Jsonable, JsonableDict
 
 import os
+import re
 from abc import ABC, abstractmethod
-from pulumi import automation as pauto
 from urllib.parse import urlparse, ParseResult, urlunparse, unquote as url_unquote
-from copy import deepcopy
-import boto3.session
-from boto3.session import Session as BotoAwsSession
-#from botocore.session import Session as BotocoreSession
-import tempfile
-import json
-import requests
+try:
+  from orjson import loads as _json_loads
+except ImportError:
+  from json import loads as _json_loads  #type: ignore[assignment]
 from threading import Lock
+import warnings
 
 from project_init_tools import file_url_to_pathname, full_name_of_type, full_type, pathname_to_file_url
 from .exceptions import XPulumiError
@@ -37,9 +35,89 @@ from .project import XPulumiProject
 
 import yaml
 try:
-  from yaml import CLoader as Loader, CDumper as Dumper
+  from yaml import CSafeLoader as Loader, CSafeDumper as Dumper
 except ImportError:
-  from yaml import Loader, Dumper  #type: ignore[misc]
+  from yaml import SafeLoader as Loader, SafeDumper as Dumper  #type: ignore[misc]
+  warnings.warn("libyaml is not available; stack config files will be parsed with the slower pure-Python YAML loader")
+
+# Parsed stack config files, keyed by pathname, with the (st_mtime_ns, st_size) they were parsed at
+_config_file_cache: Dict[str, Tuple[int, int, Optional[JsonableDict]]] = {}
+_config_file_cache_lock = Lock()
+
+def _parse_json_config(data: bytes) -> Optional[JsonableDict]:
+  return _json_loads(data)
+
+def _parse_yaml_config(data: bytes) -> Optional[JsonableDict]:
+  return yaml.load(data, Loader=Loader)
+
+def _slurp(pathname: str, size: int) -> bytes:
+  """Reads an entire file with unbuffered reads sized to its expected length (normally
+     one read for the content plus one for EOF)."""
+  fd = os.open(pathname, os.O_RDONLY)
+  try:
+    chunks: List[bytes] = []
+    chunk_size = size + 1
+    while True:
+      chunk = os.read(fd, chunk_size)
+      if len(chunk) == 0:
+        break
+      chunks.append(chunk)
+  finally:
+    os.close(fd)
+  return b''.join(chunks)
+
+def _load_config_file(
+      pathname: str,
+      parse: Callable[[bytes], Optional[JsonableDict]],
+      st: Optional[os.stat_result]=None
+    ) -> Optional[JsonableDict]:
+  """Loads and parses a stack config file, reusing the previously parsed result if the
+     file has not changed since it was last parsed.
+
+  If the caller already has the file's stat result (e.g., from os.scandir), it may be passed in
+  as st to avoid another stat call.
+
+  The returned dict is shared between all XPulumiStack instances that load the same file,
+  and must not be modified.
+  """
+  if st is None:
+    st = os.stat(pathname)
+  with _config_file_cache_lock:
+    cached = _config_file_cache.get(pathname, None)
+  if not cached is None and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+    return cached[2]
+  data = _slurp(pathname, st.st_size)
+  result = parse(data)
+  with _config_file_cache_lock:
+    _config_file_cache[pathname] = (st.st_mtime_ns, st.st_size, result)
+  return result
+
+_QUALIFIED_STACK_NAME_RE = re.compile(r'^([^:]*):([^:]*)$')
+
+def _split_qualified_stack_name(
+      stack_name: Optional[str],
+      project_name: Optional[str],
+      project: Optional[XPulumiProject]
+    ) -> Tuple[Optional[str], Optional[str]]:
+  """Splits a fully qualified "<project>:<stack>" stack name, checking it against
+     any explicitly provided project name or project.
+
+  Returns:
+      Tuple[Optional[str], Optional[str]]: (project_name, stack_name)
+  """
+  if not stack_name is None and ':' in stack_name:
+    m = _QUALIFIED_STACK_NAME_RE.match(stack_name)
+    if m is None:
+      raise XPulumiError(f"Malformed stack name: {stack_name}")
+    qual_project_name, unqual_stack_name = m.group(1, 2)
+    if qual_project_name != '':
+      if not project_name is None and project_name != qual_project_name:
+        raise XPulumiError(f"project_name \"{project_name}\" conflicts with fully qualified stack name \"{stack_name}")
+      if not project is None and project.name != qual_project_name:
+        raise XPulumiError(f"project name \"{project.name}\" conflicts with fully qualified stack name \"{stack_name}")
+      project_name = qual_project_name
+    stack_name = None if unqual_stack_name == '' else unqual_stack_name
+  return project_name, stack_name
 
 def parse_stack_name(
       stack_name: Optional[str]=None,
@@ -54,19 +132,7 @@ def parse_stack_name(
     stack_name = None
   if project_name == '':
     project_name = None
-  if not stack_name is None:
-    # support fully qualified "<project>:<stack>" stack name
-    if ':' in stack_name:
-      stack_name_parts = stack_name.split(':')
-      if len(stack_name_parts) != 2:
-        raise XPulumiError(f"Malformed stack name: {stack_name}")
-      if stack_name_parts[0] != '':
-        if not project_name is None and project_name != stack_name_parts[0]:
-          raise XPulumiError(f"project_name \"{project_name}\" conflicts with fully qualified stack name \"{stack_name}")
-        if not project is None and project.name != stack_name_parts[0]:
-          raise XPulumiError(f"project name \"{project.name}\" conflicts with fully qualified stack name \"{stack_name}")
-        project_name = stack_name_parts[0]
-      stack_name = None if stack_name_parts[1] == '' else stack_name_parts[1]
+  project_name, stack_name = _split_qualified_stack_name(stack_name, project_name, project)
   if project_name is None and project is None:
     project_name = default_project_name
   if project_name is None:
@@ -90,19 +156,53 @@ def parse_stack_name(
   return project_name, stack_name
 
 class XPulumiStack:
+  __slots__ = (
+      '_project',
+      '_pulumi_project_name',
+      '_stack_name',
+      '_full_stack_name',
+      '_xcfg_file',
+      '_xcfg_data',
+      '_cfg_data',
+      '_pulumi_cfg_file',
+      '_pulumi_cfg_data',
+      '_cached_stack_outputs_lock',
+      '_cached_stack_outputs',
+      '_cloud_subaccount',
+      '_include_in_all_up',
+      '_include_in_destroy_all',
+      '_decrypted_pulumi_config_values',
+      '_unencrypted_pulumi_config_values',
+      '_config_has_secrets',
+      '_cfg_loaded',
+      '_pulumi_cfg_loaded',
+      '_pulumi_cfg_entry',
+      '_stack_dependencies',
+      '_repr',
+    )
+
   _project: XPulumiProject
-  _stack_name: Optional[str] = None
+  _pulumi_project_name: str
+  _stack_name: str
+  _full_stack_name: str
   _xcfg_file: str
   _xcfg_data: JsonableDict
   _cfg_data: JsonableDict
   _pulumi_cfg_file: str
-  _pulumi_cfg_data: Optional[JsonableDict] = None
+  _pulumi_cfg_data: Optional[JsonableDict]
   _cached_stack_outputs_lock: Lock
   _cached_stack_outputs: Dict[Tuple[bool, bool], JsonableDict]
-  _cloud_subaccount: Optional[str] = None
-  _include_in_all_up: bool = True
-  _include_in_destroy_all: bool = True
-  _decrypted_pulumi_config_values: Optional[JsonableDict] = None
+  _cloud_subaccount: Optional[str]
+  _include_in_all_up: bool
+  _include_in_destroy_all: bool
+  _decrypted_pulumi_config_values: Optional[JsonableDict]
+  _unencrypted_pulumi_config_values: Optional[JsonableDict]
+  _config_has_secrets: Optional[bool]
+  _cfg_loaded: bool
+  _pulumi_cfg_loaded: bool
+  _pulumi_cfg_entry: Optional['os.DirEntry[str]']
+  _stack_dependencies: Optional[List['XPulumiStack']]
+  _repr: Optional[str]
 
   def __init__(
         self,
@@ -116,23 +216,23 @@ class XPulumiStack:
       ):
     self._cached_stack_outputs_lock = Lock()
     self._cached_stack_outputs = {}
+    self._pulumi_cfg_data = None
+    self._cloud_subaccount = None
+    self._include_in_all_up = True
+    self._include_in_destroy_all = True
+    self._decrypted_pulumi_config_values = None
+    self._unencrypted_pulumi_config_values = None
+    self._config_has_secrets = None
+    self._cfg_loaded = False
+    self._pulumi_cfg_loaded = False
+    self._pulumi_cfg_entry = None
+    self._stack_dependencies = None
+    self._repr = None
     if stack_name == '':
       stack_name = None
     if project_name == '':
       project_name = None
-    if not stack_name is None:
-      # support fully qualified "<project>:<stack>" stack name
-      if ':' in stack_name:
-        stack_name_parts = stack_name.split(':')
-        if len(stack_name_parts) != 2:
-          raise XPulumiError(f"Malformed stack name: {stack_name}")
-        if stack_name_parts[0] != '':
-          if not project_name is None and project_name != stack_name_parts[0]:
-            raise XPulumiError(f"project_name \"{project_name}\" conflicts with fully qualified stack name \"{stack_name}")
-          if not project is None and project.name != stack_name_parts[0]:
-            raise XPulumiError(f"project name \"{project.name}\" conflicts with fully qualified stack name \"{stack_name}")
-          project_name = stack_name_parts[0]
-        stack_name = None if stack_name_parts[1] == '' else stack_name_parts[1]
+    project_name, stack_name = _split_qualified_stack_name(stack_name, project_name, project)
     if project is None:
       if project_name is None:
         project_name = default_project_name
@@ -150,59 +250,104 @@ class XPulumiStack:
     stack_name = project.get_stack_name(stack_name)
 
     self._project = project
+    self._pulumi_project_name = project.pulumi_project_name
     self._stack_name = stack_name
+    self._full_stack_name = f"{project.name}:{stack_name}"
 
+  def _load_cfg(self) -> None:
+    """Loads the stack's config files on first use, so that stacks that are only
+    needed by name (e.g., while walking stack dependencies) never read them."""
+    if self._cfg_loaded:
+      return
+    project = self.project
+    stack_name = self.stack_name
     project_dir = project.project_dir
+    # One directory read tells us which of the candidate config files exist, and
+    # provides their stat results for the config file cache.
+    with os.scandir(project_dir) as it:
+      dir_entries = { e.name: e for e in it }
+    # DirEntry.path is already joined with project_dir, so pathnames are only built
+    # for files that do not exist.
     xcfg_data: Optional[JsonableDict] = None
-    cfg_file_json = os.path.join(project_dir, f"xpulumi-stack.{stack_name}.json")
-    cfg_file_yaml = os.path.join(project_dir, f"xpulumi-stack.{stack_name}.yaml")
-    if os.path.exists(cfg_file_json):
-      self._xcfg_file = cfg_file_json
-      with open(cfg_file_json, encoding='utf-8') as f:
-        xcfg_data = cast(JsonableDict, json.load(f))
-    elif os.path.exists(cfg_file_yaml):
-      self._xcfg_file = cfg_file_yaml
-      with open(cfg_file_yaml, encoding='utf-8') as f:
-        xcfg_text = f.read()
-      xcfg_data = cast(JsonableDict, yaml.load(xcfg_text, Loader=Loader))
+    cfg_entry_json = dir_entries.get(f"xpulumi-stack.{stack_name}.json", None)
+    cfg_entry_yaml = dir_entries.get(f"xpulumi-stack.{stack_name}.yaml", None)
+    for cfg_entry, parse in ((cfg_entry_json, _parse_json_config), (cfg_entry_yaml, _parse_yaml_config)):
+      if not cfg_entry is None:
+        try:
+          xcfg_data = _load_config_file(cfg_entry.path, parse, cfg_entry.stat())
+        except FileNotFoundError:
+          # removed since the directory was scanned
+          continue
+        self._xcfg_file = cfg_entry.path
+        break
     if xcfg_data is None:
       xcfg_data = {}
     assert isinstance(xcfg_data, dict)
     self._xcfg_data = xcfg_data
-    pulumi_cfg_data: Optional[JsonableDict] = None
-    pulumi_cfg_file = os.path.join(project_dir, f'Pulumi.{stack_name}.yaml')
-    self._pulumi_cfg_file = pulumi_cfg_file
-    if os.path.exists(pulumi_cfg_file):
-      with open(pulumi_cfg_file, encoding='utf-8') as f:
-        pulumi_cfg_text = f.read()
-      pulumi_cfg_data = cast(JsonableDict, yaml.load(pulumi_cfg_text, Loader=Loader))
-      assert isinstance(pulumi_cfg_data, dict)
-      self._pulumi_cfg_data = pulumi_cfg_data
+    pulumi_cfg_entry = dir_entries.get(f'Pulumi.{stack_name}.yaml', None)
+    if not pulumi_cfg_entry is None:
+      try:
+        # Caches the stat result on the entry for _load_pulumi_cfg
+        pulumi_cfg_entry.stat()
+      except FileNotFoundError:
+        # removed since the directory was scanned
+        pulumi_cfg_entry = None
+    if pulumi_cfg_entry is None:
+      self._pulumi_cfg_file = os.path.join(project_dir, f'Pulumi.{stack_name}.yaml')
+    else:
+      self._pulumi_cfg_file = pulumi_cfg_entry.path
+    # Pulumi.<stack>.yaml is not parsed until the pulumi config is needed; see _load_pulumi_cfg
+    self._pulumi_cfg_entry = pulumi_cfg_entry
 
-    cfg_data: JsonableDict = {}
-    if not pulumi_cfg_data is None:
-      cfg_data['pulumi_config'] = deepcopy(pulumi_cfg_data)
-    if not xcfg_data is None:
-      cfg_data.update(xcfg_data)
-    cfg_data['project_dir'] = project_dir
-    self._cfg_data = cfg_data
-    cloud_subaccount = cast(Optional[str], cfg_data.get('cloud_subaccount', None))
+    # Settings that live at the top level of cfg_data can only come from the xpulumi-stack config
+    cloud_subaccount = xcfg_data.get('cloud_subaccount', None)
+    assert cloud_subaccount is None or isinstance(cloud_subaccount, str)
     if cloud_subaccount is None:
       cloud_subaccount = project.cloud_subaccount
     self._cloud_subaccount = cloud_subaccount
-    include_in_all_up = cast(bool, cfg_data.get("include_in_all_up", True))
+    include_in_all_up = xcfg_data.get("include_in_all_up", True)
     assert isinstance(include_in_all_up, bool)
     self._include_in_all_up = include_in_all_up and project.include_in_all_up
-    include_in_destroy_all = cast(bool, cfg_data.get("include_in_destroy_all", True))
+    include_in_destroy_all = xcfg_data.get("include_in_destroy_all", True)
     assert isinstance(include_in_destroy_all, bool)
     self._include_in_destroy_all = include_in_destroy_all and project.include_in_destroy_all
+    self._cfg_loaded = True
+
+  def _load_pulumi_cfg(self) -> None:
+    """Parses Pulumi.<stack>.yaml and builds cfg_data on first use."""
+    if self._pulumi_cfg_loaded:
+      return
+    self._load_cfg()
+    pulumi_cfg_data: Optional[JsonableDict] = None
+    pulumi_cfg_entry = self._pulumi_cfg_entry
+    if not pulumi_cfg_entry is None:
+      try:
+        pulumi_cfg_data = _load_config_file(pulumi_cfg_entry.path, _parse_yaml_config, pulumi_cfg_entry.stat())
+      except FileNotFoundError:
+        # removed since the directory was scanned; treat it as absent, like the xpulumi-stack config
+        self._pulumi_cfg_entry = None
+      else:
+        assert isinstance(pulumi_cfg_data, dict)
+        self._pulumi_cfg_data = pulumi_cfg_data
+
+    # pulumi_cfg_data is shared with the config file cache, so it is not copied here;
+    # cfg_data is read-only.
+    cfg_data: JsonableDict = {}
+    if not pulumi_cfg_data is None:
+      cfg_data['pulumi_config'] = pulumi_cfg_data
+    cfg_data.update(self._xcfg_data)
+    cfg_data['project_dir'] = self.project.project_dir
+    self._cfg_data = cfg_data
+    self._pulumi_cfg_loaded = True
 
   @property
   def include_in_all_up(self) -> bool:
+    self._load_cfg()
     return self._include_in_all_up
 
   @property
   def include_in_destroy_all(self) -> bool:
+    self._load_cfg()
     return self._include_in_destroy_all
 
   @property
@@ -215,7 +360,6 @@ class XPulumiStack:
 
   @property
   def stack_name(self) -> str:
-    assert not self._stack_name is None
     return self._stack_name
 
   @property
@@ -224,10 +368,11 @@ class XPulumiStack:
 
   @property
   def full_stack_name(self) -> str:
-    return f"{self.project_name}:{self.stack_name}"
+    return self._full_stack_name
 
   @property
   def cloud_subaccount(self) -> Optional[str]:
+    self._load_cfg()
     return self._cloud_subaccount
 
   @property
@@ -236,7 +381,7 @@ class XPulumiStack:
 
   @property
   def pulumi_project_name(self) -> str:
-    return self.project.pulumi_project_name
+    return self._pulumi_project_name
 
   @property
   def project_dir(self) -> str:
@@ -248,6 +393,9 @@ class XPulumiStack:
 
   @property
   def cfg_data(self) -> JsonableDict:
+    """The merged stack configuration. Parts of it are shared with other XPulumiStack
+    instances, so it must not be modified."""
+    self._load_pulumi_cfg()
     return self._cfg_data
 
   def abspath(self, pathname: str) -> str:
@@ -279,19 +427,24 @@ class XPulumiStack:
         decrypt_secrets: bool=False,
         bypass_pulumi: bool=True,
       ) -> JsonableDict:
-    with self._cached_stack_outputs_lock:
-      result = self._cached_stack_outputs.get((decrypt_secrets, bypass_pulumi))
-      if result is None:
-        result = self.project.get_stack_outputs(
-            self.stack_name,
-            decrypt_secrets=decrypt_secrets,
-            bypass_pulumi=bypass_pulumi
-          )
-        self._cached_stack_outputs[(decrypt_secrets, bypass_pulumi)] = result
+    key = (decrypt_secrets, bypass_pulumi)
+    # Cached results are never replaced, so a hit can safely skip the lock
+    result = self._cached_stack_outputs.get(key)
+    if result is None:
+      with self._cached_stack_outputs_lock:
+        result = self._cached_stack_outputs.get(key)
+        if result is None:
+          result = self.project.get_stack_outputs(
+              self.stack_name,
+              decrypt_secrets=decrypt_secrets,
+              bypass_pulumi=bypass_pulumi
+            )
+          self._cached_stack_outputs[key] = result
     return result
 
   def pulumi_config_exists(self) -> bool:
-    return not self._pulumi_cfg_data is None
+    self._load_cfg()
+    return not self._pulumi_cfg_entry is None
 
   def is_initable(self) -> bool:
     """Returns True if it is allowed to create this stack in the pulumi backend"""
@@ -303,46 +456,55 @@ class XPulumiStack:
     return self.pulumi_config_exists() and self.is_initable()
 
   def get_pulumi_config(self) -> JsonableDict:
+    self._load_pulumi_cfg()
     result = self._pulumi_cfg_data
     if result is None:
       result = {}
     return result
 
+  def config_has_secrets(self) -> bool:
+    """Returns True if any of this stack's Pulumi config values are encrypted secrets"""
+    result = self._config_has_secrets
+    if result is None:
+      unencrypted = self.get_config_values(decrypt_secrets=False)
+      result = any(isinstance(v, dict) and 'secure' in v for v in unencrypted.values())
+      self._config_has_secrets = result
+    return result
+
   def get_decrypted_config_values(self) -> JsonableDict:
     if self._decrypted_pulumi_config_values is None:
       # avoid slow passphrase hash generation if there are not
       # any secrets in this stack's config
       unencrypted = self.get_config_values(decrypt_secrets=False)
-      has_encrypted = False
-      for v in unencrypted.values():
-        if isinstance(v, dict) and 'secure' in v:
-          has_encrypted = True
-          break
-      if has_encrypted:
+      if self.config_has_secrets():
         decrypted_text = self.check_output_stack_pulumi(['config', '--show-secrets', '-j'])
-        decrypted_data = cast(JsonableDict, json.loads(decrypted_text))
+        decrypted_data = _json_loads(decrypted_text)
         assert isinstance(decrypted_data, dict)
         result: JsonableDict = {}
         for k, v in decrypted_data.items():
           assert isinstance(v, dict) and 'value' in v
           result[k] = v['value']
       else:
-        result = deepcopy(unencrypted)
+        # no secrets, so the decrypted values are the raw values, which are read-only
+        result = unencrypted
       self._decrypted_pulumi_config_values = result
     return self._decrypted_pulumi_config_values
 
   def get_config_values(self, decrypt_secrets: bool=True) -> JsonableDict:
     if decrypt_secrets:
-      result = self.get_decrypted_config_values()
-    else:
+      return self.get_decrypted_config_values()
+    result: Optional[JsonableDict] = self._unencrypted_pulumi_config_values
+    if result is None:
       pc = self.get_pulumi_config()
-      result = cast(JsonableDict, pc.get('config', {}))
-      assert isinstance(result, dict)
+      config = pc.get('config', {})
+      assert isinstance(config, dict)
+      result = config
+      self._unencrypted_pulumi_config_values = result
     return result
 
   def get_config_value(self, name: str, default: Jsonable=None, decrypt_secrets: bool=True) -> Jsonable:
     if name.startswith(':'):
-      name = self.pulumi_project_name + name
+      name = self._pulumi_project_name + name
     # we avoid fetching decrypted values unless necessary
     unencrypted = self.get_config_values(decrypt_secrets=False)
     result: Jsonable = unencrypted.get(name, None)
@@ -354,7 +516,7 @@ class XPulumiStack:
 
   def require_config_value(self, name: str, decrypt_secrets: bool=True) -> Jsonable:
     if name.startswith(':'):
-      name = self.pulumi_project_name + name
+      name = self._pulumi_project_name + name
     # we avoid fetching decrypted values unless necessary
     unencrypted = self.get_config_values(decrypt_secrets=False)
     if not name in unencrypted:
@@ -370,8 +532,12 @@ class XPulumiStack:
     return result
 
   def get_stack_dependencies(self) -> List['XPulumiStack']:
-    project = self.project
-    result = project.get_stack_dependencies(self.stack_name)
+    """Returns the stacks this stack directly depends on. The result is computed once
+    and shared between calls, so it must not be modified."""
+    result = self._stack_dependencies
+    if result is None:
+      result = self.project.get_stack_dependencies(self.stack_name)
+      self._stack_dependencies = result
     return result
 
   def get_stack_build_order(self, include_self: bool=False) -> List['XPulumiStack']:
@@ -396,10 +562,14 @@ class XPulumiStack:
     return self.project.get_stack_resource_count(self.stack_name)
 
   def __str__(self) -> str:
-    return f"<XPulumi stack {self.full_stack_name}>"
+    return f"<XPulumi stack {self._full_stack_name}>"
 
   def __repr__(self) -> str:
-    return f"<XPulumi stack {self.full_stack_name}, id={id(self)}>"
+    result = self._repr
+    if result is None:
+      result = f"<XPulumi stack {self._full_stack_name}, id={id(self)}>"
+      self._repr = result
+    return result
 
   def check_call_stack_pulumi(
         self,
@@ -28,8 +28,7 @@ def load_stack(resource_prefix: str = '', cfg_prefix: str = '', export_prefix: s
     )
   #pulumi.log.info(f"backend_url={backend_url}")
   bucket_name, backend_subkey = split_s3_uri(backend_url)
-  while backend_subkey.endswith('/'):
-    backend_subkey = backend_subkey[:-1]
+  backend_subkey = backend_subkey.rstrip('/')
 
   aws.s3.Bucket(f"{resource_prefix}bucket",
       bucket=bucket_name,
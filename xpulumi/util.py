@@ -11,6 +11,7 @@ from .internal_types import Jsonable
 import json
 import hashlib
 import os
+import re
 from urllib.parse import urlparse, ParseResult, urlunparse, unquote as url_unquote
 import pathlib
 import subprocess
@@ -19,12 +20,33 @@ import tempfile
 
 from .exceptions import XPulumiError
 
+def coerce_pulumi_int(x: Any) -> Any:
+  """Rounds a float to an int (Pulumi serializes all numbers as floats); returns other values unchanged.
+
+  bool values are returned unchanged, so callers that require an int should still reject them.
+  """
+  return round(x) if isinstance(x, float) else x
+
+# Matches the common, well-formed case without the cost of urlparse. The bucket ends at
+# the first '/', '?' or '#', and any query or fragment (e.g., "?region=us-west-2" on a
+# Pulumi backend URL) is dropped, as urlparse would. Anything else, such as an
+# upper-case scheme, leading whitespace or embedded tabs/newlines, goes to urlparse.
+_S3_URI_RE = re.compile(r'^s3://([^/?#\[\]\t\r\n]*)((?:/[^?#\t\r\n]*)?)(?:[?#][^\t\r\n]*)?\Z')
+
 def split_s3_uri(uri: str) -> Tuple[str, str]:
-  parts = urlparse(uri)
-  if parts.scheme != 's3':
-    raise XPulumiError(f"Invalid 's3:' URL: {uri}")
-  bucket = parts.netloc
-  key = parts.path
-  while key.startswith('/'):
-    key = key[1:]
-  return bucket, key
+  """Splits an 's3://<bucket>/<key>' URI into its bucket and key.
+
+  The key has leading slashes removed, and any query string or fragment is discarded,
+  so '?' and '#' cannot appear in either part.
+  """
+  m = _S3_URI_RE.match(uri)
+  if m is None:
+    parts = urlparse(uri)
+    if parts.scheme != 's3':
+      raise XPulumiError(f"Invalid 's3:' URL: {uri}")
+    bucket = parts.netloc
+    key = parts.path
+  else:
+    bucket = m.group(1)
+    key = m.group(2)
+  return bucket, key.lstrip('/')